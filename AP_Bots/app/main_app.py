@@ -259,11 +259,15 @@ else:
         selected_bot = st.session_state.pending_bot
         
         with st.status(f"🚀 Loading {selected_bot}...", expanded=True) as status:
+            st.session_state.chatbot.shutdown()
             st.session_state.chatbot = get_llm(selected_bot)
             status.update(label=f"{selected_bot} loaded successfully!", state="complete")
             del st.session_state["pending_bot"]
 
     # --------------------- CHAT INTERFACE -----------------------------
+    # Any response still streaming belongs to a previous run of the script.
+    st.session_state.chatbot.cancel_generation()
+
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
@@ -6,5 +6,5 @@ def get_sentiment_polarity(text):
 def get_vader_sent_polarity(text):
     return FeatureProcessor.get_vader_sent_polarity(text)
 
-def get_bert_sentiment(text):
-    return FeatureProcessor.get_bert_sentiment(text)
\ No newline at end of file
+def get_bert_sentiment(text, backend="torch"):
+    return FeatureProcessor.get_bert_sentiment(text, backend=backend)
\ No newline at end of file
@@ -0,0 +1,12 @@
+from AP_Bots.utils.argument_parser import parse_args
+from AP_Bots.utils.misc import get_model_list
+from AP_Bots.utils.prompt_store import build_prompt_stores
+from AP_Bots.utils.exp_utils import get_config_name
+
+args, dataset, final_feature_list, k = parse_args()
+
+LLMs = args.models if args.models else get_model_list()
+config_name = get_config_name(dataset, final_feature_list, args.retriever, args.repetition_step, k)
+
+print(f"Building prompts for {dataset.tag} with Features: {final_feature_list}, Retriever: {args.retriever}, Repetition Step: {args.repetition_step} and K: {k}")
+build_prompt_stores(dataset, args, k, config_name, LLMs)
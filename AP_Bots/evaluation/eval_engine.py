@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from AP_Bots.utils.file_utils import parse_filename
+from AP_Bots.utils.output_parser import parse_react_output, parse_r1_output
+from AP_Bots.evaluation.metrics import METRICS, METRIC_VERSIONS, ROUGE_TYPES, get_metric_tokens, compute_metrics, get_corpus_scores
+
+worker_gt_tokens = None
+
+
+def init_eval_worker(gt_tokens):
+
+    global worker_gt_tokens
+    worker_gt_tokens = gt_tokens
+
+
+def load_preds(pred_path, params):
+
+    with open(pred_path, "r") as f:
+        preds = [p["output"] for p in json.load(f)["golds"]]
+
+    if params["PS"] == "react":
+        preds = [parse_react_output(p) for p in preds]
+
+    if params["model"].startswith("R1"):
+        preds = [parse_r1_output(p)[1] for p in preds]
+
+    return preds
+
+
+def eval_pred_file(pred_path, params, metrics):
+
+    preds = load_preds(pred_path, params)
+    if len(preds) != len(next(iter(worker_gt_tokens.values()))):
+        return None
+    return compute_metrics(get_metric_tokens(preds, metrics), worker_gt_tokens, metrics)
+
+
+def write_indv_results(store, runs, out_path, columns=ROUGE_TYPES):
+
+    all_scores = dict()
+    for run in runs:
+        scores = store.read(run, columns)
+        all_scores[run] = {"params": store.get_params(run)} | {column: scores[column].tolist() for column in columns if column in scores}
+
+    with open(out_path, "w") as f:
+        json.dump(all_scores, f)
+
+
+def write_total_results(store, runs, out_path):
+
+    # Corpus scores are derived from the stored per-sample scores, so they always agree with the per-sample view.
+    cols = ["model", "features", "retriever", "RS", "k", "PS"]
+    cols.extend(ROUGE_TYPES + ["bleu", "meteor"])
+    all_res = [store.get_params(run) | get_corpus_scores(store.read(run, ROUGE_TYPES + ["bleu_stats", "meteor"])) for run in runs]
+
+    df = pd.DataFrame(all_res, columns=cols)
+    df = df[cols]
+    df = df.round(dict([(c, 4) for c in df.columns if df[c].dtype == "float64"]))
+    df.to_csv(out_path, index=False, columns=cols)
+
+
+class EvalEngine:
+    """
+    Scores the prediction files of a dataset. The ground truths are tokenised once per metric and shared with
+    the worker processes, each of which scores whole prediction files, so a sweep is evaluated in parallel.
+    """
+
+    def __init__(self, dataset, metrics=METRICS, num_workers=1, preds_dir=os.path.join("files", "preds")):
+
+        self.dataset = dataset
+        self.metrics = metrics
+        self.num_workers = num_workers
+        self.preds_dir = preds_dir
+        self.gt_tokens = None
+
+    def get_gt_tokens(self):
+
+        if self.gt_tokens is None:
+            self.gt_tokens = get_metric_tokens(self.dataset.get_gts(), self.metrics)
+        return self.gt_tokens
+
+    def get_pred_files(self):
+        return sorted(file for file in os.listdir(self.preds_dir) if file.startswith(self.dataset.tag) and file.endswith(".json"))
+
+    def evaluate(self, files, file_metrics=None):
+        """
+        Yields the file name, its parameters and its per-sample scores for each file in the given order, scores
+        are None if the file doesn't cover every sample. file_metrics can limit the metrics computed per file.
+        """
+
+        if not files:
+            return
+
+        paths = [os.path.join(self.preds_dir, file) for file in files]
+        all_params = [parse_filename(file, self.dataset.tag) for file in files]
+        file_metrics = [self.metrics] * len(files) if file_metrics is None else file_metrics
+
+        if self.num_workers > 1 and len(files) > 1:
+            with ProcessPoolExecutor(self.num_workers, initializer=init_eval_worker, initargs=(self.get_gt_tokens(),)) as executor:
+                for file, params, scores in zip(files, all_params, executor.map(eval_pred_file, paths, all_params, file_metrics)):
+                    yield file, params, scores
+        else:
+            init_eval_worker(self.get_gt_tokens())
+            for file, path, params, metrics in zip(files, paths, all_params, file_metrics):
+                yield file, params, eval_pred_file(path, params, metrics)
+
+    def update(self, store):
+        """
+        Scores the prediction files that are new or changed since they were stored, for their stale metrics only,
+        and returns the runs whose stored scores are current for every metric of the engine.
+        """
+
+        metric_versions = {metric: METRIC_VERSIONS[metric] for metric in self.metrics}
+        pred_files = self.get_pred_files()
+        files, file_metrics, file_hashes = [], [], []
+        for file in pred_files:
+            file_hash = store.get_file_hash(os.path.join(self.preds_dir, file))
+            stale_metrics = store.get_stale_metrics(file[:-5], file_hash, metric_versions)
+            if stale_metrics:
+                files.append(file)
+                file_metrics.append(stale_metrics)
+                file_hashes.append(file_hash)
+
+        print(f"{len(pred_files) - len(files)} of {len(pred_files)} prediction files are already evaluated!")
+        incomplete = set()
+        for (file, params, scores), metrics, file_hash in zip(self.evaluate(files, file_metrics), file_metrics, file_hashes):
+
+            print(f"Model: {params['model']}, Retriever: {params['retriever']}, Features: {params['features']}, RS: {params['RS']}, K: {params['k']}, PS: {params['PS']}")
+            sys.stdout.flush()
+            if scores is None:
+                incomplete.add(file)
+                continue
+            store.write(file[:-5], params, file_hash, scores, {metric: metric_versions[metric] for metric in metrics})
+
+        return [file[:-5] for file in pred_files if file not in incomplete]
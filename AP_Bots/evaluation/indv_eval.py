@@ -1,66 +1,24 @@
-import json
 import os
-import sys
 
-from evaluate import load
 from openai import OpenAI
 
-from AP_Bots.utils.file_utils import oai_get_batch_res, parse_filename
+from AP_Bots.utils.batch_manager import BatchManager
+from AP_Bots.utils.eval_store import EvalStore
 from AP_Bots.utils.argument_parser import parse_args
+from AP_Bots.evaluation.eval_engine import EvalEngine, write_indv_results
 
-_, dataset, _, _ = parse_args()
+args, dataset, _, _ = parse_args()
 
-preds_dir = os.path.join("files", "preds")
 out_dir = os.path.join("evaluation", "files", "indv")
 os.makedirs(out_dir, exist_ok=True)
 file_out_name = os.path.join(out_dir, f"eval_{dataset.tag}.json")
 
 client = OpenAI()
-oai_get_batch_res(client)
+BatchManager(client).poll()
 
-out_gts = dataset.get_gts()
-all_rouge_scores = {}
+store = EvalStore(dataset.tag)
+engine = EvalEngine(dataset, metrics=["rouge"], num_workers=args.eval_workers)
+runs = engine.update(store)
 
-rouge = load("rouge")
-
-if os.path.exists(file_out_name):
-    with open(file_out_name, "r") as f:
-        all_rouge_scores = json.load(f)
-else:
-    all_rouge_scores = dict()
-
-for file in os.listdir(preds_dir):
-
-    if file.startswith(dataset.tag) and file.endswith(".json"):
-
-        params = parse_filename(file, dataset.tag)
-        print(f"Model: {params['model']}, Retriever: {params['retriever']}, Features: {params['features']}, RS: {params['RS']}, K: {params['k']}")
-
-        if file[:-5] in all_rouge_scores.keys():
-            print("Individual eval for this already concluded!")
-            continue
-
-        with open(os.path.join(preds_dir, file), "r") as f:
-            preds = json.load(f)["golds"]
-            preds = [p["output"] for p in preds]
-
-        if len(preds) != len(out_gts):
-            continue
-
-        sys.stdout.flush()
-        rouge_res = []
-        for pred, gt in zip(preds, out_gts):
-            
-            score = rouge.compute(predictions=[pred], references=[gt])
-            rouge_res.append(score)
-
-        all_rouge_scores[file[:-5]] = {
-            "params": params,
-            "rouge1": [r["rouge1"] for r in rouge_res],
-            "rouge2": [r["rouge2"] for r in rouge_res],
-            "rougeL": [r["rougeL"] for r in rouge_res],
-            "rougeLsum": [r["rougeLsum"] for r in rouge_res],
-        }
-        
-        with open(file_out_name, "w") as f:
-            json.dump(all_rouge_scores, f)
\ No newline at end of file
+# The JSON view is exported from the store, so only new or changed prediction files were scored.
+write_indv_results(store, runs, file_out_name)
\ No newline at end of file
@@ -0,0 +1,7 @@
+# Metric names and versions, kept apart from the scorers so loading stored results doesn't import NLTK.
+METRICS = ["rouge", "bleu", "meteor"]
+# Stored scores are keyed by these versions, bump one when its scoring changes so stored scores are recomputed.
+METRIC_VERSIONS = {"rouge": 1, "bleu": 1, "meteor": 1}
+ROUGE_TYPES = ["rouge1", "rouge2", "rougeL", "rougeLsum"]
+# Stored score columns of each metric.
+METRIC_COLUMNS = {"rouge": ROUGE_TYPES, "bleu": ["bleu", "bleu_stats"], "meteor": ["meteor"]}
@@ -0,0 +1,247 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from nltk.stem.porter import PorterStemmer
+from nltk.tokenize import word_tokenize
+from nltk.translate.meteor_score import single_meteor_score
+
+from AP_Bots.utils.nlp_resources import init_nltk
+from AP_Bots.evaluation.metric_types import METRICS, METRIC_VERSIONS, ROUGE_TYPES
+
+# Tokenisation and scoring follow rouge_score's defaults, which evaluate's rouge wraps, so the
+# per-sample scores match evaluate.load("rouge") with use_aggregator=False.
+NON_ALPHANUM_RE = re.compile(r"[^a-z0-9]+")
+
+# BLEU follows evaluate's bleu: the 13a tokenizer, up to 4-grams and no smoothing.
+BLEU_MAX_ORDER = 4
+BLEU_TOKEN_RES = [
+    (re.compile(r"([\{-\~\[-\` -\&\(-\+\:-\@\/])"), r" \1 "),
+    (re.compile(r"([^0-9])([\.,])"), r"\1 \2 "),
+    (re.compile(r"([\.,])([^0-9])"), r" \1 \2"),
+    (re.compile(r"([0-9])(-)"), r"\1 \2 ")
+]
+
+# METEOR follows evaluate's meteor, which averages NLTK's sentence scores.
+METEOR_PARAMS = {"alpha": 0.9, "beta": 3, "gamma": 0.5}
+
+
+class CachedStemmer:
+    """
+    Stemmer with a per-process word cache, so words shared by references and many prediction files are stemmed once.
+    """
+
+    def __init__(self, stemmer):
+        self.stem = lru_cache(maxsize=2**18)(stemmer.stem)
+
+
+rouge_stemmer = CachedStemmer(PorterStemmer("ORIGINAL_ALGORITHM"))
+meteor_stemmer = CachedStemmer(PorterStemmer())
+
+
+def rouge_tokenize(text, use_stemmer=False):
+
+    tokens = NON_ALPHANUM_RE.sub(" ", text.lower()).split()
+    if use_stemmer:
+        tokens = [rouge_stemmer.stem(token) if len(token) > 3 else token for token in tokens]
+    return tokens
+
+
+def get_rouge_tokens(texts, use_stemmer=False):
+    """
+    Tokens of each text for rouge1/2/L and the tokens of each of its lines for rougeLsum.
+    """
+    return [(rouge_tokenize(text, use_stemmer), [rouge_tokenize(line, use_stemmer) for line in text.split("\n") if line])
+            for text in texts]
+
+
+def get_ngram_stats(pred_tokens, ref_tokens, n):
+
+    pred_ngrams = Counter(zip(*[pred_tokens[i:] for i in range(n)]))
+    ref_ngrams = Counter(zip(*[ref_tokens[i:] for i in range(n)]))
+    return sum((pred_ngrams & ref_ngrams).values()), sum(pred_ngrams.values()), sum(ref_ngrams.values())
+
+
+def lcs_length(a, b):
+
+    # Bit-parallel LCS: each bit of v tracks a position of a, so every token of b updates the whole DP row at once.
+    if not a or not b:
+        return 0
+    masks = {}
+    for i, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+
+def get_lcs_indices(ref, pred):
+
+    table = [[0] * (len(pred) + 1) for _ in range(len(ref) + 1)]
+    for i in range(1, len(ref) + 1):
+        row, prev_row, ref_token = table[i], table[i-1], ref[i-1]
+        for j in range(1, len(pred) + 1):
+            row[j] = prev_row[j-1] + 1 if ref_token == pred[j-1] else max(prev_row[j], row[j-1])
+
+    indices = []
+    i, j = len(ref), len(pred)
+    while i > 0 and j > 0:
+        if ref[i-1] == pred[j-1]:
+            indices.append(i-1)
+            i, j = i - 1, j - 1
+        elif table[i][j-1] > table[i-1][j]:
+            j -= 1
+        else:
+            i -= 1
+    return indices
+
+
+def get_summary_lcs_stats(pred_sents, ref_sents):
+
+    pred_len, ref_len = sum(map(len, pred_sents)), sum(map(len, ref_sents))
+    if not pred_len or not ref_len:
+        return 0, pred_len, ref_len
+
+    pred_counts = Counter(token for sent in pred_sents for token in sent)
+    ref_counts = Counter(token for sent in ref_sents for token in sent)
+    hits = 0
+    for ref in ref_sents:
+        # Union LCS of the reference line against every predicted line, each token matched at most as often as it occurs.
+        for i in sorted(set().union(*[get_lcs_indices(ref, pred) for pred in pred_sents])):
+            token = ref[i]
+            if pred_counts[token] > 0 and ref_counts[token] > 0:
+                hits += 1
+                pred_counts[token] -= 1
+                ref_counts[token] -= 1
+    return hits, pred_len, ref_len
+
+
+def get_rouge_stats(pred, ref):
+    """
+    (hits, prediction count, reference count) of each ROUGE type for a tokenised pair from get_rouge_tokens.
+    """
+
+    (pred_tokens, pred_sents), (ref_tokens, ref_sents) = pred, ref
+    return {
+        "rouge1": get_ngram_stats(pred_tokens, ref_tokens, 1),
+        "rouge2": get_ngram_stats(pred_tokens, ref_tokens, 2),
+        "rougeL": (lcs_length(ref_tokens, pred_tokens), len(pred_tokens), len(ref_tokens)),
+        "rougeLsum": get_summary_lcs_stats(pred_sents, ref_sents)
+    }
+
+
+def get_fmeasure(stats):
+
+    hits, pred_counts, ref_counts = np.asarray(stats, dtype=np.float64).reshape(-1, 3).T
+    precision = hits / np.maximum(pred_counts, 1)
+    recall = hits / np.maximum(ref_counts, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+
+def compute_rouge(preds, refs, use_stemmer=False):
+    """
+    Per-sample ROUGE F-measures of a whole prediction file as one array per type. Predictions and references
+    can be raw texts or the output of get_rouge_tokens, so references shared by many files are tokenised once.
+    """
+
+    if preds and isinstance(preds[0], str):
+        preds = get_rouge_tokens(preds, use_stemmer)
+    if refs and isinstance(refs[0], str):
+        refs = get_rouge_tokens(refs, use_stemmer)
+
+    all_stats = [get_rouge_stats(pred, ref) for pred, ref in zip(preds, refs)]
+    return {rouge_type: get_fmeasure([stats[rouge_type] for stats in all_stats]) for rouge_type in ROUGE_TYPES}
+
+
+def bleu_tokenize(text):
+
+    text = text.replace("<skipped>", "").replace("-\n", "").replace("\n", " ")
+    if "&" in text:
+        text = text.replace("&quot;", '"').replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+    text = f" {text} "
+    for token_re, repl in BLEU_TOKEN_RES:
+        text = token_re.sub(repl, text)
+    return text.split()
+
+
+def get_bleu_stats(pred_tokens, ref_tokens):
+    """
+    BLEU sufficient statistics of a pair: matched and possible n-grams of each order, then the prediction
+    and reference lengths. Summing them over samples gives the corpus statistics.
+    """
+
+    ngram_stats = [get_ngram_stats(pred_tokens, ref_tokens, n) for n in range(1, BLEU_MAX_ORDER + 1)]
+    return [hits for hits, _, _ in ngram_stats] + [pred_count for _, pred_count, _ in ngram_stats] + [len(pred_tokens), len(ref_tokens)]
+
+
+def get_bleu(stats):
+
+    stats = np.asarray(stats, dtype=np.float64).reshape(-1, 2 * BLEU_MAX_ORDER + 2)
+    matches, possible = stats[:, :BLEU_MAX_ORDER], stats[:, BLEU_MAX_ORDER:2 * BLEU_MAX_ORDER]
+    pred_lens, ref_lens = stats[:, -2], stats[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precisions = np.where(possible > 0, matches / possible, 0.0)
+        geo_mean = np.where(precisions.min(axis=1) > 0, np.exp(np.log(precisions).mean(axis=1)), 0.0)
+        ratio = pred_lens / ref_lens
+        brevity_penalty = np.where(ratio > 1, 1.0, np.exp(1 - 1 / ratio))
+    # evaluate fails on empty predictions, they score 0 here.
+    return np.where(pred_lens > 0, geo_mean * brevity_penalty, 0.0)
+
+
+def meteor_tokenize(text):
+
+    init_nltk()
+    return word_tokenize(text)
+
+
+def compute_meteor(preds, refs):
+    return np.array([single_meteor_score(ref, pred, stemmer=meteor_stemmer, **METEOR_PARAMS) for pred, ref in zip(preds, refs)], dtype=np.float64)
+
+
+def get_metric_tokens(texts, metrics=METRICS):
+    """
+    Tokens of the texts for each metric, e.g. references tokenised once and shared by every prediction file.
+    """
+
+    tokens = {}
+    if "rouge" in metrics:
+        tokens["rouge"] = get_rouge_tokens(texts)
+    if "bleu" in metrics:
+        tokens["bleu"] = [bleu_tokenize(text) for text in texts]
+    if "meteor" in metrics:
+        tokens["meteor"] = [meteor_tokenize(text) for text in texts]
+    return tokens
+
+
+def compute_metrics(pred_tokens, ref_tokens, metrics=METRICS):
+    """
+    Per-sample scores of a prediction file from the tokens of get_metric_tokens. BLEU also keeps its per-sample
+    sufficient statistics, as corpus BLEU isn't the mean of the sample scores.
+    """
+
+    scores = {}
+    if "rouge" in metrics:
+        scores |= compute_rouge(pred_tokens["rouge"], ref_tokens["rouge"])
+    if "bleu" in metrics:
+        scores["bleu_stats"] = np.array([get_bleu_stats(pred, ref) for pred, ref in zip(pred_tokens["bleu"], ref_tokens["bleu"])], dtype=np.float64)
+        scores["bleu"] = get_bleu(scores["bleu_stats"])
+    if "meteor" in metrics:
+        scores["meteor"] = compute_meteor(pred_tokens["meteor"], ref_tokens["meteor"])
+    return scores
+
+
+def get_corpus_scores(scores):
+    """
+    Corpus scores from per-sample scores: ROUGE and METEOR are averaged, as evaluate does, and BLEU is computed
+    from the summed statistics.
+    """
+
+    corpus_scores = {metric: float(np.mean(values)) for metric, values in scores.items() if metric in ROUGE_TYPES + ["meteor"]}
+    if "bleu_stats" in scores:
+        corpus_scores["bleu"] = float(get_bleu(np.sum(scores["bleu_stats"], axis=0))[0])
+    return corpus_scores
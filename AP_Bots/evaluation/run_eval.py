@@ -0,0 +1,27 @@
+import os
+
+from openai import OpenAI
+
+from AP_Bots.utils.batch_manager import BatchManager
+from AP_Bots.utils.eval_store import EvalStore
+from AP_Bots.utils.argument_parser import parse_args
+from AP_Bots.evaluation.metrics import METRICS, ROUGE_TYPES
+from AP_Bots.evaluation.eval_engine import EvalEngine, write_indv_results, write_total_results
+
+# Scores every metric once per prediction file and writes both the per-sample JSON and the corpus CSV from them.
+args, dataset, _, _ = parse_args()
+
+indv_dir = os.path.join("evaluation", "files", "indv")
+total_dir = os.path.join("evaluation", "files", "total")
+os.makedirs(indv_dir, exist_ok=True)
+os.makedirs(total_dir, exist_ok=True)
+
+client = OpenAI()
+BatchManager(client).poll()
+
+store = EvalStore(dataset.tag)
+engine = EvalEngine(dataset, metrics=METRICS, num_workers=args.eval_workers)
+runs = engine.update(store)
+
+write_indv_results(store, runs, os.path.join(indv_dir, f"eval_{dataset.tag}.json"), columns=ROUGE_TYPES + ["bleu", "meteor"])
+write_total_results(store, runs, os.path.join(total_dir, f"eval_{dataset.tag}.csv"))
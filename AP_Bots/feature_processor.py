@@ -1,162 +1,122 @@
-from typing import Counter
 import os
+import copy
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from textblob import TextBlob
-import textstat
-import spacy
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk import pos_tag
-from nltk.corpus import stopwords
-from transformers import pipeline
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 from AP_Bots.utils.output_parser import extract_bfi_scores
+from AP_Bots.utils.nlp_utils import get_spacy_features, get_pos_ratios, get_profile_pos_ratios, get_word_freqs, get_vader_scores, get_bert_scores, SPACY_COMPONENTS, POS_PREFIXES
+from AP_Bots.utils.pred_store import PredStore
+from AP_Bots.utils.feature_store import FeatureStore
+from AP_Bots.utils.readability import get_word_counts, get_text_stats, get_smog, get_profile_readability, get_sentiment_scores, get_profile_sentiment, READABILITY_FEATURES, SENTIMENT_FEATURES
+
+worker_processor = None
+
+
+def init_feature_worker(processor):
+
+    global worker_processor
+    worker_processor = processor
+
+
+def compute_feature_chunk(group, author_texts):
+
+    # spaCy and NLTK models are loaded lazily, so each worker loads them once and reuses them across chunks.
+    if group[0] in SPACY_COMPONENTS:
+        columns = get_spacy_features(author_texts, group)
+    elif group[0] in READABILITY_FEATURES:
+        profiles = [get_profile_readability(texts, group) for texts in author_texts]
+        columns = {feature: [profile[feature] for profile in profiles] for feature in group}
+    elif group[0] in SENTIMENT_FEATURES:
+        profiles = [get_profile_sentiment(texts, group) for texts in author_texts]
+        columns = {feature: [profile[feature] for profile in profiles] for feature in group}
+    elif group[0] in POS_PREFIXES:
+        profiles = [get_profile_pos_ratios(texts, group) for texts in author_texts]
+        columns = {feature: [profile[feature] for profile in profiles] for feature in group}
+    else:
+        columns = {feature: [worker_processor.compute_feature(feature, texts) for texts in author_texts] for feature in group}
+    return [{feature: columns[feature][i] for feature in group} for i in range(len(author_texts))]
+
 
 class FeatureProcessor():
 
-    def __init__(self, dataset) -> None:
+    def __init__(self, dataset, num_workers=1) -> None:
         
         self.dataset = dataset
-        nltk.download('punkt', quiet=True)      
-        nltk.download('stopwords', quiet=True)  
-        nltk.download('averaged_perceptron_tagger', quiet=True)
+        self.num_workers = num_workers
         self.save_loc = os.path.join("files", "features")
         os.makedirs(self.save_loc, exist_ok=True)
 
     @staticmethod
     def get_sentence_length(texts):
-        if isinstance(texts, list):
-            return [len(text.split(" ")) for text in texts]
-        else:
-            return [len(texts.split(" "))]
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_word_counts(texts).tolist()
 
     @staticmethod
     def get_sentiment_polarity(texts):
-        if isinstance(texts, list):
-            return [TextBlob(text).sentiment.polarity for text in texts]
-        else:
-            return [TextBlob(texts).sentiment.polarity]
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_sentiment_scores(texts)[0].tolist()
 
     @staticmethod
     def get_vader_sent_polarity(texts):
-        analyzer = SentimentIntensityAnalyzer()
-        if isinstance(texts, list):
-            return [analyzer.polarity_scores(text) for text in texts]
-        else:
-            return [analyzer.polarity_scores(texts)]
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_vader_scores(texts)
 
     @staticmethod
-    def get_bert_sentiment(texts):
-        sentiment_pipeline = pipeline("sentiment-analysis")
+    def get_bert_sentiment(texts, backend="torch"):
         if not isinstance(texts, list):
             texts = [texts]
-        return sentiment_pipeline(texts)
+        return get_bert_scores(texts, backend=backend)
 
     @staticmethod
     def get_subjectivity(texts):
-        if isinstance(texts, list):
-            return [TextBlob(text).sentiment.subjectivity for text in texts]
-        else:
-            return [TextBlob(texts).sentiment.subjectivity]
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_sentiment_scores(texts)[1].tolist()
     
     @staticmethod
     def get_smog_index(texts):
-        if isinstance(texts, list):
-            return [textstat.smog_index(text) for text in texts]
-        else:
-            return [textstat.smog_index(texts)]
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_smog(get_text_stats(texts)).tolist()
                             
     @staticmethod
     def get_adverb_usage(texts):
-        res = []
         if not isinstance(texts, list):
             texts = [texts]
 
-        for text in texts:
-            words = word_tokenize(text.lower())
-            pos_tags = pos_tag(words)
-            adverbs = [word for word, pos in pos_tags if pos.startswith('RB')]
-            res.append(round((len(adverbs) / len(words)) * 100, 2))
-
-        return res
+        return [get_pos_ratios(text, ["ADVU"])["ADVU"] for text in texts]
     
     @staticmethod
     def get_adjective_usage(texts):
-        res = []
         if not isinstance(texts, list):
             texts = [texts]
 
-        for text in texts:
-            words = word_tokenize(text.lower())
-            pos_tags = pos_tag(words)
-            adjectives = [word for word, pos in pos_tags if pos.startswith('JJ')]
-            res.append(round((len(adjectives) / len(words)) * 100, 2))
-
-        return res
+        return [get_pos_ratios(text, ["ADJU"])["ADJU"] for text in texts]
     
     @staticmethod
     def get_pronoun_usage(texts):
-        res = []
         if not isinstance(texts, list):
             texts = [texts]
 
-        for text in texts:
-            words = word_tokenize(text.lower())
-            pos_tags = pos_tag(words)
-            pronouns = [word for word, pos in pos_tags if pos.startswith('PRP')]
-            res.append(round((len(pronouns) / len(words)) * 100, 2))
-
-        return res
+        return [get_pos_ratios(text, ["PU"])["PU"] for text in texts]
 
     @staticmethod
     def get_word_frequency(texts):
-        texts = " ".join(texts)
-        words = word_tokenize(texts.lower())
-        stop_words = set(stopwords.words('english'))
-        filtered_words = [word for word in words if word.isalpha() and word not in stop_words]
-        
-        word_freq = Counter(filtered_words)
-        total_words = sum(word_freq.values())
-
-        word_freq_percentage = {word: round((count / total_words) * 100, 3) for word, count in word_freq.items()} if total_words > 0 else {} 
-        sorted_word_freq_percentage = list(sorted(word_freq_percentage.items(), key=lambda item: item[1], reverse=True))   
-
-        return sorted_word_freq_percentage
+        if not isinstance(texts, list):
+            texts = [texts]
+        return get_word_freqs(texts)
 
     def get_named_entity_freqency(self, texts):
-        texts = " ".join(texts)
-        nlp = spacy.load("en_core_web_sm")
-        doc = nlp(texts)
-        named_entities = [(ent.text, ent.label_) for ent in doc.ents]
-        
-        entity_counter = Counter(named_entities)
-        total_entities = sum(entity_counter.values())
-        
-        sorted_entities = [
-            ((ent, label), round((count / total_entities) * 100, 2))
-            for (ent, label), count in entity_counter.most_common()
-        ]
-        
-        return sorted_entities
+        return get_spacy_features([texts], ["NEF"])["NEF"][0]
     
     def get_dep_pattern_frequency(self, texts):
-        texts = " ".join(texts)
-        nlp = spacy.load("en_core_web_sm")
-        doc = nlp(texts)
-        
-        dependency_patterns = [(token.text, token.dep_) for token in doc]
-        pattern_counter = Counter(dependency_patterns)
-        total_patterns = sum(pattern_counter.values())
-        
-        sorted_patterns = [
-            (pattern, round((count / total_patterns) * 100, 2))
-            for pattern, count in pattern_counter.most_common()
-        ]
-
-        return sorted_patterns
+        return get_spacy_features([texts], ["DPF"])["DPF"][0]
     
     @staticmethod
     def get_bfi_scores(texts):
@@ -226,18 +186,45 @@ class FeatureProcessor():
             }
         }
 
-    def get_feat_file(self, file_name):
-        file_path = os.path.join(self.save_loc, f"{file_name}.json")
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                return json.load(f)
+    def compute_feature(self, feature, texts):
+
+        func = self.feat_name_mappings()[feature]["func"]
+        if feature == "WF":
+            return func(texts)
+        return float(np.mean(func(texts)))
+
+    def compute_feature_group(self, group, all_texts, file_name, partial_key, chunk_size=64):
+
+        # Finished authors are appended to a partial log, so an interrupted run resumes where it stopped.
+        # The key identifies the authors being computed, so a log is never resumed for a different set.
+        partial_store = PredStore(os.path.join(self.save_loc, "partial", f"{file_name}_{'-'.join(group)}_{partial_key}.jsonl"))
+        if len(partial_store):
+            print(f"Resuming {group} from author {len(partial_store)}")
+
+        chunks = [all_texts[i:i+chunk_size] for i in range(len(partial_store), len(all_texts), chunk_size)]
+        # Workers only need the feature functions, not the loaded dataset.
+        light_processor = copy.copy(self)
+        light_processor.dataset = None
+
+        if self.num_workers > 1:
+            with ProcessPoolExecutor(self.num_workers, initializer=init_feature_worker, initargs=(light_processor,)) as executor:
+                for records in executor.map(compute_feature_chunk, [group] * len(chunks), chunks):
+                    for record in records:
+                        partial_store.append(record)
         else:
-            return dict()
+            init_feature_worker(light_processor)
+            for chunk in chunks:
+                for record in compute_feature_chunk(group, chunk):
+                    partial_store.append(record)
+        partial_store.close()
 
-    def save_feat_file(self, file_name, obj):
-        file_path = os.path.join(self.save_loc, f"{file_name}.json")
-        with open(file_path, "w") as f:
-            json.dump(obj, f)
+        columns = {feature: [] for feature in group}
+        for record in partial_store.read():
+            for feature in group:
+                columns[feature].append(record[feature])
+        if os.path.exists(partial_store.path):
+            os.remove(partial_store.path)
+        return columns
 
     def get_all_features(self, feature_list):
 
@@ -246,33 +233,73 @@ class FeatureProcessor():
 
         author_texts = retr_gts
         full_auth_texts = retr_texts if retr_texts != retr_gts else author_texts
-        author_features = self.get_feat_file(file_name)
+        feature_store = FeatureStore(self.dataset.tag, self.save_loc)
         feature_mappings = self.feat_name_mappings()
 
+        # Features computed before the column store are imported from the monolithic JSON file.
+        legacy_path = os.path.join(self.save_loc, f"{file_name}.json")
+        if os.path.exists(legacy_path) and not all(feature_store.has(feature) for feature in feature_list):
+            feature_store.import_json(legacy_path, feature_list)
+
+        if "BFI" in feature_list and not feature_store.has("BFI"):
+            print("Preparing BFI")
+            bfi_path = "personality_analysis/files/inferred_bfi/amazon_Grocery_and_Gourmet_Food_2018_UP_BFI_GEMMA-2-27B.json"
+            with open(bfi_path, "r") as f:
+                bfi_texts = json.load(f)
+            feature_store.write("BFI", [feature_mappings["BFI"]["func"](text) for text in bfi_texts])
+
+        # Only authors whose profile texts changed since a feature was stored are recomputed.
+        fingerprints = {
+            "author": [FeatureStore.get_fingerprint(texts) for texts in author_texts],
+            "full": [FeatureStore.get_fingerprint(texts) for texts in full_auth_texts]
+        }
+        stale_rows = {}
         for feature in feature_list:
-            if feature not in author_features.keys():
-                print(f"Preparing {feature}")
-                if feature in ["NEF", "DPF"]:
-                    author_features[feature] = [feature_mappings[feature]["func"](text) for text in full_auth_texts]
-                elif feature == "BFI":
-                    bfi_path = "personality_analysis/files/inferred_bfi/amazon_Grocery_and_Gourmet_Food_2018_UP_BFI_GEMMA-2-27B.json"
-                    with open(bfi_path, "r") as f:
-                        bfi_texts = json.load(f)
-                    author_features[feature] = [feature_mappings[feature]["func"](text) for text in bfi_texts]
+            if feature == "BFI":
+                continue
+            fps = fingerprints["full" if feature in SPACY_COMPONENTS else "author"]
+            old_fps = feature_store.read_fingerprints(feature) if feature_store.has(feature) else None
+            if old_fps is None and feature_store.has(feature) and len(feature_store.read(feature)) == len(fps):
+                # Features stored without fingerprints are assumed to match the current texts.
+                feature_store.write_fingerprints(feature, fps)
+            elif old_fps != fps:
+                old_fps = set(old_fps) if old_fps else set()
+                stale_rows[feature] = [i for i, fp in enumerate(fps) if fp not in old_fps]
+
+        # Features sharing a pass over the texts (one spaCy parse, one POS tagging, one readability or sentiment
+        # analysis) are computed together.
+        pending = list(stale_rows.keys())
+        shared = [SPACY_COMPONENTS, POS_PREFIXES, READABILITY_FEATURES, SENTIMENT_FEATURES]
+        groups = [[feature for feature in pending if feature in group_features] for group_features in shared]
+        groups = [group for group in groups if group] + [[feature] for feature in pending if not any(feature in group_features for group_features in shared)]
+
+        for group in groups:
+            all_texts = full_auth_texts if group[0] in SPACY_COMPONENTS else author_texts
+            fps = fingerprints["full" if group[0] in SPACY_COMPONENTS else "author"]
+            rows = sorted(set().union(*(stale_rows[feature] for feature in group)))
+            print(f"Preparing {group} for {len(rows)}/{len(all_texts)} authors")
+            partial_key = hashlib.md5("".join(fps[i] for i in rows).encode()).hexdigest()[:8]
+            columns = self.compute_feature_group(group, [all_texts[i] for i in rows], file_name, partial_key)
+
+            for feature in group:
+                new_values = dict(zip(rows, columns[feature]))
+                if len(rows) < len(fps):
+                    old_fps = feature_store.read_fingerprints(feature)
+                    old_rows = {fp: i for i, fp in enumerate(old_fps)}
+                    old_values = feature_store.read(feature)
+                    values = [new_values[i] if i in new_values else old_values[old_rows[fp]] for i, fp in enumerate(fps)]
                 else:
-                    if feature == "WF" or feature == "BFI":
-                        author_features[feature] = [feature_mappings[feature]["func"](text) for text in author_texts]
-                    else:
-                        author_features[feature] = [np.mean(feature_mappings[feature]["func"](text)) for text in author_texts]
-            self.save_feat_file(file_name, author_features)
-        return author_features
+                    values = columns[feature]
+                feature_store.write(feature, values, fps)
+        return feature_store
     
-    def prepare_features(self, feature_list, top_k=10):
+    def prepare_features(self, feature_list, top_k=10, rows=None):
 
-        all_features = self.get_all_features(feature_list)
+        feature_store = self.get_all_features(feature_list)
+        all_features = {feature: feature_store.read(feature, rows, top_k) for feature in feature_list}
 
         all_author_features = []
-        for i in range(len(all_features[list(all_features.keys())[0]])):
+        for i in range(len(all_features[feature_list[0]])):
             proc_author_features = []
             for feature in feature_list:
                 if not feature.endswith("F") and feature != "BFI":
@@ -1,17 +1,22 @@
 import configparser
 import os
 import json
-from threading import Thread
+from threading import Thread, Event
+from queue import Queue
 from pathlib import Path
 import copy
+import time
+import random
+import hashlib
 import warnings
 warnings.filterwarnings("ignore")
 
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaRAMCache, LlamaDiskCache
 from huggingface_hub import login, logging, hf_hub_download, snapshot_download
 logging.set_verbosity_error()
 import tiktoken
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline, logging, BitsAndBytesConfig, AsyncTextIteratorStreamer
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline, logging, BitsAndBytesConfig, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 logging.set_verbosity_error()
 
 from openai import OpenAI
@@ -21,9 +26,8 @@ import google.generativeai as genai
 
 class LLM:
 
-    def __init__(self, model_name, default_prompt=None, model_params=None, gen_params=None) -> None:
+    def __init__(self, model_name, default_prompt=None, model_params=None, gen_params=None, load_model=True) -> None:
         
-        login(token=os.getenv("HF_API_KEY"), new_session=False)
         self.cfg = LLM.get_cfg()[model_name]
         self.model_name = model_name
         self.family = model_name.split("-")[0]
@@ -31,11 +35,17 @@ class LLM:
         self.file_name = self.cfg.get("file_name", None)
         self.context_length = int(self.cfg.get("context_length"))
         self.provider = self.get_provider()
+        if self.provider != "MOCK":
+            login(token=os.getenv("HF_API_KEY"), new_session=False)
         self.tokenizer = self.init_tokenizer()
         self.model_params = self.get_model_params(model_params)
         self.gen_params = self.get_gen_params(gen_params)
-        self.model = self.init_model()
+        self.model = self.init_model() if load_model or self.provider not in ["HF", "GGUF"] else None
         self.default_prompt = default_prompt if default_prompt is not None else []
+        self.prefix_stats = {"prompts": 0, "hits": 0, "prompt_tokens": 0, "reused_tokens": 0}
+        self.hf_worker = None
+        self.cur_request = None
+        self.stream_stats = {}
 
     @staticmethod
     def get_cfg():
@@ -59,7 +69,7 @@ class LLM:
 
         if self.provider in ["GROQ", "GGUF", "DEEPSEEK"]:
             return AutoTokenizer.from_pretrained(self.cfg.get("tokenizer"), use_fast=True)
-        elif self.provider in ["ANTHROPIC", "OPENAI", "GOOGLE"]:
+        elif self.provider in ["ANTHROPIC", "OPENAI", "GOOGLE", "MOCK"]:
             return None
         else:
             return AutoTokenizer.from_pretrained(self.repo_id, use_fast=True)
@@ -112,12 +122,25 @@ class LLM:
                 return {
                     "api_key": os.getenv("GOOGLE_API_KEY")
                 }
-            elif self.provider == "GGUF":
+            elif self.provider == "MOCK":
                 return {
+                    "latency": float(self.cfg.get("latency", 0)),
+                    "tokens_per_second": float(self.cfg.get("tokens_per_second", 0)),
+                    "failure_rate": float(self.cfg.get("failure_rate", 0)),
+                    "seed": int(self.cfg.get("seed", 0))
+                }
+            elif self.provider == "GGUF":
+                params = {
                     "n_gpu_layers": -1,
                     "verbose": True,
                     "n_ctx": self.context_length
                 }
+                # The prompt cache is opt-in (bytes for a RAM cache or a directory for a disk cache): sorted prompts already
+                # reuse the in-context prefix, while a cache copies the whole KV state after every completion.
+                prompt_cache = self.cfg.get("prompt_cache")
+                if prompt_cache:
+                    params["prompt_cache"] = int(prompt_cache) if prompt_cache.isdigit() else prompt_cache
+                return params
             else:
                 return {}
         else:
@@ -132,6 +155,8 @@ class LLM:
         elif self.provider == "GOOGLE":
             genai.configure(**self.model_params)
             return genai.GenerativeModel(self.repo_id)
+        elif self.provider == "MOCK":
+            return MockModel(**self.model_params)
         elif self.provider == "GGUF":
             if os.getenv("HF_HOME") is None:
                 hf_cache_path = os.path.join(os.path.expanduser('~'), ".cache", "huggingface", "hub")
@@ -146,7 +171,13 @@ class LLM:
             if not self.file_name.endswith("gguf"):
                 len_files = len(os.listdir(model_path))
                 model_path = f"{model_path}/{self.file_name}-00001-of-0000{len_files}.gguf"
-            return Llama(model_path=model_path, **self.model_params)
+            prompt_cache = self.model_params.pop("prompt_cache", None)
+            model = PrefixTrackingLlama(model_path=model_path, **self.model_params)
+            if isinstance(prompt_cache, int):
+                model.set_cache(LlamaRAMCache(capacity_bytes=prompt_cache))
+            elif isinstance(prompt_cache, str):
+                model.set_cache(LlamaDiskCache(cache_dir=prompt_cache))
+            return model
         else: 
             bnb_config = None
             if "quantization" in self.model_params:
@@ -161,6 +192,11 @@ class LLM:
                     quantization_config=bnb_config,
                     device_map="auto")
 
+    def load(self):
+
+        if self.model is None:
+            self.model = self.init_model()
+
     def format_prompt(self, prompt, params=None):
         """
         Ensure that the prompt is a list of dictionaries in the format:
@@ -233,21 +269,79 @@ class LLM:
             total_hist_tokens -= self.count_tokens(removed_message['content'])
         return chat_history 
        
-    def count_tokens(self, prompt):
+    def get_tokenizer_key(self):
+
+        if self.tokenizer is not None:
+            tokenizer_name = self.tokenizer.name_or_path
+        elif self.provider == "OPENAI":
+            tokenizer_name = tiktoken.encoding_for_model(self.repo_id).name
+        else:
+            tokenizer_name = f"{self.provider}-{self.repo_id}"
+        tokenizer_name = tokenizer_name.replace("/", "--")
+        return f"{tokenizer_name}_CL({self.context_length})_MT({self.gen_params[self.name_token_var]})"
+
+    def count_tokens(self, prompt, local=False):
 
         prompt = self.format_prompt(prompt)
         
         prompt_text = "\n".join([turn["content"] for turn in prompt])
-        
-        if self.provider == "OPENAI":
+        if local:
+            return self.count_local_tokens([prompt_text])[0]
+        return self.count_text_tokens([prompt_text])[0]
+
+    def count_text_tokens(self, texts):
+
+        if not texts:
+            return []
+        elif self.provider == "OPENAI":
             encoding = tiktoken.encoding_for_model(self.repo_id)
-            return len(encoding.encode(prompt_text))
+            return [len(ids) for ids in encoding.encode_batch(texts)]
         elif self.provider == "GOOGLE":
-            return self.model.count_tokens(prompt_text).total_tokens
+            return [self.model.count_tokens(text).total_tokens for text in texts]
         elif self.provider == "ANTHROPIC":
-            return self.model.count_tokens(prompt_text)
+            return [self.model.count_tokens(text) for text in texts]
+        elif self.provider == "MOCK":
+            return [len(text.split()) for text in texts]
         else:
-            return len(self.tokenizer(prompt_text).input_ids)
+            return [len(ids) for ids in self.tokenizer(texts).input_ids]
+
+    def count_local_tokens(self, texts):
+
+        # Google and Anthropic only count tokens remotely, so their counts are approximated at ~4 characters per token.
+        if self.provider in ["GOOGLE", "ANTHROPIC"]:
+            return [round(len(text) / 4) for text in texts]
+        return self.count_text_tokens(texts)
+
+    def pack_contexts(self, prompt, query, contexts, overheads=None):
+        """
+        Fits several document lists into one token budget: the context window minus the generation budget,
+        the prompt and the query. Every document is counted once, the lists are packed in priority order
+        and each keeps its longest prefix of documents that fits in what the previous lists left. A list's
+        overhead (e.g. its wrapper tags) is only charged if any of its documents are kept.
+        """
+
+        overheads = overheads if overheads else [0] * len(contexts)
+        # Counts are local, so packing the prompts of API models doesn't make a remote call per document.
+        budget = self.context_length - self.gen_params[self.name_token_var] - self.count_tokens(prompt, local=True)
+        budget -= self.count_tokens(query, local=True) if query else 0
+        doc_lens = iter(self.count_local_tokens([doc for docs in contexts for doc in docs]))
+
+        packed = []
+        for docs, overhead in zip(contexts, overheads):
+            lens = [next(doc_lens) for _ in docs]
+            num_kept, used = 0, overhead
+            for doc_len in lens:
+                # Documents after the first also cost their newline separator.
+                cost = doc_len + (1 if num_kept else 0)
+                if used + cost > budget:
+                    print("Context exceeds context window, removing documents!")
+                    break
+                used += cost
+                num_kept += 1
+            if num_kept:
+                budget -= used
+            packed.append(docs[:num_kept])
+        return packed
         
     def prepare_context(self, prompt, context, query=None, chat_history=[]):
 
@@ -270,6 +364,30 @@ class LLM:
         else:
             return -1
 
+    def update_prefix_stats(self, prev_tokens, n_prompt_tokens):
+        """
+        Track how much of a llama.cpp prompt was served from the KV state it started from: the state left by
+        the previous call, or the one restored from the prompt cache. llama.cpp only evaluates the tokens after
+        the longest common prefix, so the prefix length is the number of prompt-eval tokens saved for this call.
+        """
+        if self.model.restored_tokens is not None:
+            prev_tokens = self.model.restored_tokens
+        prompt_tokens = self.model.input_ids[:n_prompt_tokens].tolist()
+        reused = Llama.longest_token_prefix(prev_tokens, prompt_tokens)
+        # The last prompt token is always re-evaluated to get fresh logits.
+        reused = min(reused, max(n_prompt_tokens - 1, 0))
+        self.prefix_stats["prompts"] += 1
+        self.prefix_stats["hits"] += int(reused > 0)
+        self.prefix_stats["prompt_tokens"] += n_prompt_tokens
+        self.prefix_stats["reused_tokens"] += reused
+
+    def get_prefix_stats(self):
+
+        stats = dict(self.prefix_stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["prompts"], 4) if stats["prompts"] else 0
+        stats["saved_ratio"] = round(stats["reused_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0
+        return stats
+
     @staticmethod
     def parse_json(output):
         try:
@@ -356,40 +474,240 @@ class LLM:
             )
             output = response.text 
 
+        elif self.provider == "MOCK":
+            prompt_text = "\n".join([turn["content"] for turn in prompt])
+            output = self.model.generate(prompt_text, gen_params[self.name_token_var], stream=stream)
+            if stream:
+                return output
+
         else:
             if self.family in ["MISTRAL", "GEMMA"]:
                 if len(prompt) > 1:
                     prompt = [{"role": "user", "content": "\n".join([turn["content"] for turn in prompt])}]
             if self.provider == "GGUF":
+                prev_tokens = self.model._input_ids.tolist()
+                self.model.restored_tokens = None
                 response = self.model.create_chat_completion(prompt, stream=False, **gen_params)
+                self.update_prefix_stats(prev_tokens, response["usage"]["prompt_tokens"])
                 output = response["choices"][-1]["message"]["content"]
             else:
                 if stream:
                     return self.stream_hf_output(prompt, gen_params)
-                else:
-                    streamer = None
-                pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, streamer=streamer, **gen_params)
-                output = pipe(prompt)[0]["generated_text"][-1]["content"]
+                output = self.get_hf_worker().submit(prompt, gen_params).result()
 
         if json_output:
             output = self.parse_json(output)
 
         return output
 
-    
-    async def stream_hf_output(self, prompt, gen_params):
-
-        streamer = AsyncTextIteratorStreamer(self.tokenizer, skip_prompt=True)
-
-        pipe = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, streamer=streamer, **gen_params)
-        thread = Thread(target=pipe, args=(prompt,))
-        thread.start()
-
-        async for token in streamer:
-            if token in ["<end_of_turn>", "<eot>", "<eos>", "<|eot_id|>", "<｜end▁of▁sentence｜>"]:
-                continue
-            elif token.strip() == "<think>":
-                yield "**Thinking..\n\n**"
-            elif token.strip() == "</think>":
-                yield "**\n\nFinished Thinking!**"
-            yield token
\ No newline at end of file
+    def get_hf_worker(self):
+
+        if self.hf_worker is None:
+            self.hf_worker = HFGenerationWorker(self.model, self.tokenizer)
+        return self.hf_worker
+
+    def cancel_generation(self):
+
+        if self.cur_request is not None:
+            self.cur_request.cancel()
+
+    def shutdown(self):
+
+        self.cancel_generation()
+        if self.hf_worker is not None:
+            self.hf_worker.stop()
+            self.hf_worker = None
+
+    def stream_hf_output(self, prompt, gen_params):
+
+        self.cancel_generation()
+        request = self.get_hf_worker().submit(prompt, gen_params, stream=True)
+        self.cur_request = request
+
+        start_time = time.time()
+        first_token_time = None
+        finished = False
+        failed = False
+        output = ""
+        try:
+            for token in request.streamer:
+                if not token or token in ["<end_of_turn>", "<eot>", "<eos>", "<|eot_id|>", "<｜end▁of▁sentence｜>"]:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.time()
+                output += token
+                if token.strip() == "<think>":
+                    yield "**Thinking..\n\n**"
+                elif token.strip() == "</think>":
+                    yield "**\n\nFinished Thinking!**"
+                else:
+                    yield token
+            # The streamer is also ended when generation fails, so the worker's error is re-raised here.
+            try:
+                request.result()
+            except Exception:
+                failed = True
+                raise
+            finished = True
+        finally:
+            # Stops the worker if the consumer went away before the response was finished.
+            request.cancel()
+            # Stats are only recorded for requests that didn't fail, the error propagates to the caller.
+            if not failed:
+                end_time = time.time()
+                num_tokens = len(self.tokenizer(output, add_special_tokens=False).input_ids)
+                gen_time = end_time - first_token_time if first_token_time else 0
+                self.stream_stats = {
+                    "ttft": round(first_token_time - start_time, 3) if first_token_time else None,
+                    "tokens": num_tokens,
+                    "tokens_per_sec": round(num_tokens / gen_time, 2) if gen_time > 0 else None,
+                    "cancelled": not finished
+                }
+                print(f"{self.model_name} stream stats: {self.stream_stats}")
+
+
+class PrefixTrackingLlama(Llama):
+    """
+    Llama that records the tokens of the last state restored from its prompt cache, so prefix reuse is
+    measured against the state llama.cpp actually continued from.
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+        self.restored_tokens = None
+
+    def load_state(self, state):
+
+        self.restored_tokens = state.input_ids[:state.n_tokens].tolist()
+        super().load_state(state)
+
+
+class GenerationRequest:
+
+    def __init__(self, prompt, gen_params, streamer=None):
+
+        self.prompt = prompt
+        self.gen_params = gen_params
+        self.streamer = streamer
+        self.cancelled = Event()
+        self.done = Event()
+        self.output = None
+        self.error = None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def result(self):
+
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.output
+
+
+class CancelCriteria(StoppingCriteria):
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class HFGenerationWorker:
+    """
+    Long-lived generation thread for a local HF model.
+
+    The text-generation pipeline is built once and requests are served one at a time from a queue.
+    Streamed tokens are passed back through a TextIteratorStreamer, which is backed by a thread-safe
+    queue, and a request can be cancelled at any point, which stops generation at the next token.
+    """
+
+    def __init__(self, model, tokenizer):
+
+        self.tokenizer = tokenizer
+        self.pipe = pipeline("text-generation", model=model, tokenizer=tokenizer)
+        self.requests = Queue()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt, gen_params, stream=False):
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True) if stream else None
+        request = GenerationRequest(prompt, gen_params, streamer)
+        self.requests.put(request)
+        return request
+
+    def run(self):
+
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            try:
+                if not request.cancelled.is_set():
+                    gen_params = dict(request.gen_params)
+                    if request.streamer is not None:
+                        gen_params["streamer"] = request.streamer
+                    res = self.pipe(request.prompt, stopping_criteria=StoppingCriteriaList([CancelCriteria(request.cancelled)]), **gen_params)
+                    request.output = res[0]["generated_text"][-1]["content"]
+            except Exception as e:
+                request.error = e
+            finally:
+                if request.streamer is not None and request.output is None:
+                    request.streamer.end()
+                request.done.set()
+
+    def stop(self):
+
+        self.requests.put(None)
+        self.thread.join()
+
+
+class MockModel:
+    """
+    Offline stand-in for a model provider, used to benchmark the pipelines without API keys or GPUs.
+
+    Outputs are deterministic for a given (seed, prompt) pair and are built from the words of the prompt.
+    Calls sleep for `latency` seconds before the first token and then emit `tokens_per_second` tokens per
+    second (0 disables the delay). A seeded fraction `failure_rate` of calls raises a RuntimeError, so the
+    sequence of failures is also reproducible across runs.
+    """
+
+    fallback_vocab = ["the", "a", "good", "product", "really", "great", "title", "new", "review", "like"]
+
+    def __init__(self, latency=0, tokens_per_second=0, failure_rate=0, seed=0):
+
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.failure_rng = random.Random(seed)
+
+    def get_tokens(self, prompt_text, max_new_tokens):
+
+        digest = hashlib.sha256(f"{self.seed}:{prompt_text}".encode("utf-8")).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+        vocab = [w for w in prompt_text.split() if w.isalpha()] or self.fallback_vocab
+        return [rng.choice(vocab) for _ in range(rng.randint(1, max(1, max_new_tokens)))]
+
+    def generate(self, prompt_text, max_new_tokens, stream=False):
+
+        if self.failure_rng.random() < self.failure_rate:
+            raise RuntimeError("Simulated MOCK provider failure!")
+
+        tokens = self.get_tokens(prompt_text, max_new_tokens)
+        if stream:
+            return self.stream_tokens(tokens)
+
+        time.sleep(self.latency + (len(tokens) / self.tokens_per_second if self.tokens_per_second else 0))
+        return " ".join(tokens)
+
+    def stream_tokens(self, tokens):
+
+        time.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield token if i == 0 else f" {token}"
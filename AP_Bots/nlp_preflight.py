@@ -0,0 +1,18 @@
+import sys
+
+from AP_Bots.utils.argument_parser import get_args
+from AP_Bots.utils.nlp_utils import get_missing_resources, download_nlp_resources, NLP_RESOURCE_DIR
+
+args = get_args()
+
+if args.download:
+    print(f"Downloading NLP resources to {NLP_RESOURCE_DIR}")
+    download_nlp_resources()
+
+missing = get_missing_resources()
+if missing:
+    print(f"Missing NLP resources in {NLP_RESOURCE_DIR}: {missing}")
+    print("Run this command with -dl on a machine with network access and copy the directory over.")
+    sys.exit(1)
+
+print(f"All NLP resources are available in {NLP_RESOURCE_DIR}!")
@@ -4,6 +4,9 @@ import json
 from typing import Dict, List, Any, Tuple
 from collections import defaultdict
 
+from AP_Bots.utils.eval_store import EvalStore
+from AP_Bots.evaluation.metric_types import ROUGE_TYPES, METRIC_VERSIONS, METRIC_COLUMNS
+
 
 def get_model_and_k(exp_key: str) -> Tuple[str, int]:
     """Extract model name and k value from experiment key."""
@@ -13,10 +16,17 @@ def get_model_and_k(exp_key: str) -> Tuple[str, int]:
     return model_name, k
 
 
-def load_eval_results(eval_file_path: str, k_range: list) -> Dict[str, Any]:
+def load_eval_results(eval_file_path: str, k_range: list, metrics: List[str] = ROUGE_TYPES,
+                      pred_dir: str = os.path.join('files', 'preds')) -> Dict[str, Any]:
     """Load and filter evaluation results based on specific parameters."""
-    with open(eval_file_path, 'r') as f:
-        eval_data = json.load(f)
+    # With an evaluation store, runs are filtered on its index and only the score columns of the kept runs are read.
+    store = EvalStore(os.path.basename(eval_file_path)[len('eval_'):-len('.json')],
+                      save_loc=os.path.join(os.path.dirname(os.path.dirname(eval_file_path)), 'store'))
+    if store.exists():
+        eval_data = {run: {'params': store.get_params(run)} for run in store.get_runs()}
+    else:
+        with open(eval_file_path, 'r') as f:
+            eval_data = json.load(f)
 
     # Filter experiments based on criteria
     filtered_results = {}
@@ -29,6 +39,14 @@ def load_eval_results(eval_file_path: str, k_range: list) -> Dict[str, Any]:
             params.get('model') in ['GEMMA-2-9B', 'GEMMA-2-27B', 'LLAMA-3.1-8B', 'LLAMA-3.3-70B']):
             filtered_results[key] = value
 
+    if store.exists():
+        # Runs scored from an older prediction file or metric version are left out, as EvalEngine would rescore them.
+        metric_versions = {metric: METRIC_VERSIONS[metric] for metric, columns in METRIC_COLUMNS.items() if set(columns) & set(metrics)}
+        filtered_results = {key: value for key, value in filtered_results.items()
+                            if store.is_current(key, os.path.join(pred_dir, f"{key}.json"), metric_versions)}
+        for key, value in filtered_results.items():
+            value.update(store.read(key, metrics))
+
     return filtered_results
 
 
@@ -10,8 +10,9 @@ from openai import OpenAI
 from AP_Bots.models import LLM
 from AP_Bots.prompts import get_BFI_prompts
 from AP_Bots.utils.argument_parser import parse_args
-from AP_Bots.utils.file_utils import oai_get_or_create_file
+from AP_Bots.utils.batch_manager import BatchManager
 from AP_Bots.utils.misc import get_model_list
+from AP_Bots.utils.exp_utils import estimate_exp, print_estimate
 
 pred_path = os.path.join("files", "preds")
 bfi_path = os.path.join("personality_analysis", "files", "inferred_bfi")
@@ -20,7 +21,7 @@ args, dataset, final_feature_list, k = parse_args()
 MAX_NEW_TOKENS = 512
 TEMPERATURE = 0.01
 
-bfi_model = "LLAMA-3.3-70B"
+bfi_model = args.bfi_model
 print(f"BFI Model: {bfi_model}")
 
 model_params = None
@@ -33,9 +34,10 @@ if bfi_model.endswith("70B"):
             "bnb_4bit_use_double_quant": True
         }
     }
-llm = LLM(model_name=bfi_model, model_params=model_params)
+# A dry run only needs the tokenizer to count prompt tokens.
+llm = LLM(model_name=bfi_model, model_params=model_params, load_model=not args.dry_run)
 
-all_models = get_model_list() + ["UP"]
+all_models = (args.models if args.models else get_model_list()) + ["UP"]
 
 _, retr_texts, retr_gts = dataset.get_retr_data() 
 print(f"Number of users: {len(retr_texts)}")
@@ -110,7 +112,13 @@ for model_name in all_models:
         
         all_prompts.append(get_BFI_prompts(dataset, context))
 
-    if llm.family == "GPT" and args.openai_batch:
+    if args.dry_run:
+
+        prompt_tokens = [llm.count_tokens(prompt, local=True) for prompt in all_prompts[len(bfi_results):]]
+        est = estimate_exp(llm, prompt_tokens, MAX_NEW_TOKENS, pred_path, batch=args.openai_batch)
+        print_estimate(f"{exp_name}_BFI_{bfi_model}", est)
+
+    elif llm.family == "GPT" and args.openai_batch:
 
         batch_file_path = os.path.join(bfi_path, f"{exp_name}_BFI_{bfi_model}.jsonl")
 
@@ -122,14 +130,7 @@ for model_name in all_models:
                                                 "messages": prompt, "max_tokens": MAX_NEW_TOKENS, "temperature": TEMPERATURE}})
                 file.write(json_line + '\n')
 
-        client = OpenAI()
-        batch_input_file_id = oai_get_or_create_file(client, batch_file_path)
-
-        client.batches.create(
-            input_file_id=batch_input_file_id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h",
-        )
+        BatchManager(OpenAI()).submit(batch_file_path, bfi_out_path, kind="bfi")
 
     else:
         
@@ -5,7 +5,8 @@ import sys
 from evaluate import load
 from openai import OpenAI
 
-from AP_Bots.utils.file_utils import parse_filename, oai_get_batch_res
+from AP_Bots.utils.file_utils import parse_filename
+from AP_Bots.utils.batch_manager import BatchManager
 from AP_Bots.utils.argument_parser import parse_args
 from AP_Bots.utils.output_parser import extract_bfi_scores
 
@@ -17,7 +18,7 @@ out_dir = os.path.join("personality_analysis", "files", "bfi_results")
 os.makedirs(out_dir, exist_ok=True)
 
 client = OpenAI()
-oai_get_batch_res(client, pred_path=bfi_dir)
+BatchManager(client).poll()
 
 file_out_name = os.path.join(out_dir, f"{bfi_model}_{dataset.tag}.json")
 gt_len = len(dataset.get_gts())
@@ -1,4 +1,3 @@
-import spacy
 from collections import Counter
 import pandas as pd
 import numpy as np
@@ -9,9 +8,11 @@ import matplotlib.pyplot as plt
 import os
 
 from AP_Bots.utils.argument_parser import get_args, parse_dataset
+from AP_Bots.utils.vocab import Vocab
+from AP_Bots.utils.nlp_utils import get_spacy_nlp
 from AP_Bots.personality_analysis.analysis_utils import load_eval_results, load_predictions, get_model_and_k
 
-nlp = spacy.load("en_core_web_sm")
+nlp = get_spacy_nlp()
 
 ext_lexicons = {
     "good", "well", "new", "love",
@@ -61,18 +62,20 @@ personality_lexicons = {
     "Openness": opn_lexicons
 }
 
-
 def get_features(text):
     doc = nlp(text)
-    tokens = [t.text.lower() for t in doc if not t.is_space and not t.is_punct]
-    num_tokens = len(tokens)
+    # Tokens are interned in a per-document vocabulary and counted with one bincount, so the type count is the
+    # vocabulary size and each lexicon only looks up its own words.
+    vocab = Vocab()
+    token_counts = vocab.count(vocab.encode(t.text.lower() for t in doc if not t.is_space and not t.is_punct))
+    num_tokens = int(token_counts.sum())
     num_sents = len(list(doc.sents))
 
     # Basic lexical features
     avg_sentence_length = round((np.mean([len([t for t in sent if not t.is_space and not t.is_punct]) 
                                     for sent in doc.sents]) 
                            if num_sents > 0 else 0))
-    type_token_ratio = round(len(set(tokens)) / (num_tokens + 1e-9) if num_tokens > 0 else 0, 4)
+    type_token_ratio = round(len(vocab) / (num_tokens + 1e-9) if num_tokens > 0 else 0, 4)
 
     # POS distribution
     pos_counts = Counter([token.pos_ for token in doc])
@@ -87,7 +90,7 @@ def get_features(text):
     # Personality-based lexical features
     personality_features = {}
     for trait, lex_set in personality_lexicons.items():
-        count = sum(1 for w in tokens if w in lex_set)
+        count = sum(vocab.get_count(token_counts, w) for w in lex_set)
         ratio = round(count / (num_tokens + 1e-9), 4)
         personality_features[f"{trait.lower()}_ratio"] = ratio
 
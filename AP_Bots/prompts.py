@@ -1,33 +1,73 @@
+from string import Formatter
+
+compiled_prompts = {}
+
+
+class PromptTemplate:
+    """
+    Prompt template that is normalised and parsed once. Rendering fills the placeholder slots of a
+    preallocated segment list and joins it, instead of re-parsing the template with str.format.
+    """
+
+    def __init__(self, template):
+
+        self.template = template
+        self.segments = []
+        self.slots = []
+        for literal, field, _, _ in Formatter().parse(template):
+            if literal:
+                self.segments.append(literal)
+            if field is not None:
+                self.slots.append((len(self.segments), field))
+                self.segments.append(None)
+
+    def render(self, **values):
+
+        segments = self.segments.copy()
+        for idx, field in self.slots:
+            segments[idx] = str(values[field])
+        return "".join(segments)
+
 def strip_all(text: str) -> str:
     return "\n".join(line.strip() for line in text.splitlines())    
 
-def prepare_res_prompt(dataset, query, llm, examples, features=None, counter_examples=None, repetition_step=1):
+def get_prompt_style(llm):
 
-    if llm.model_name.startswith("DEEPSEEK-R1"):
-        prompt_style = "reason"
+    return "reason" if llm.model_name.startswith("DEEPSEEK-R1") else "regular"
 
-    if dataset.name == "lamp":
-        init_prompt = get_lamp_prompts(dataset.num, repetition_step)
-        
-    elif dataset.name == "amazon":
-        init_prompt = get_amazon_prompts(prompt_style)
+def get_compiled_prompt(dataset, prompt_style, repetition_step=1):
+
+    # The templates don't vary with the repetition step yet, it is part of the key so they can.
+    key = (dataset.tag, prompt_style, repetition_step)
+    if key not in compiled_prompts:
+        if dataset.name == "lamp":
+            compiled_prompts[key] = PromptTemplate(get_lamp_prompts(dataset.num))
+        elif dataset.name == "amazon":
+            compiled_prompts[key] = PromptTemplate(get_amazon_prompts(prompt_style))
+    return compiled_prompts[key]
+
+def prepare_res_prompt(dataset, query, llm, examples, features=None, counter_examples=None, repetition_step=1):
+
+    prompt = get_compiled_prompt(dataset, get_prompt_style(llm), repetition_step)
     
     feat_values = ""
     if features:
         feat_values = "\n".join(features)
-    
-    context = llm.prepare_context(init_prompt, examples, query=f"{query}\n{features}") 
-    ce_examples = ""
-
-    if counter_examples:
-        i = 0
-        for ce_example in counter_examples:
-            ce_context = llm.prepare_context(init_prompt, ce_example, query=f"{query}\n{feat_values}\n{context}") 
-            if context:
-                i += 1
-                ce_examples = f"{ce_examples}\n<Other Writer-{i}>\n{ce_context}\n</Other Writer-{i}>\n"
-
-    return init_prompt.format(query=query, examples=context, features=feat_values, counter_examples=ce_examples)
+
+    # The main examples and every contrastive author are fitted under a single budget in one pass.
+    contexts = [examples] + list(counter_examples or [])
+    ce_tags = [(f"\n<Other Writer-{i}>\n", f"\n</Other Writer-{i}>\n") for i in range(1, len(contexts))]
+    overheads = [0] + llm.count_local_tokens([start_tag + end_tag for start_tag, end_tag in ce_tags])
+    packed = llm.pack_contexts(prompt.template, f"{query}\n{feat_values}", contexts, overheads)
+
+    context = "\n".join(packed[0])
+    ce_examples = []
+    for ce_docs in packed[1:]:
+        if ce_docs:
+            start_tag, end_tag = ce_tags[len(ce_examples)]
+            ce_examples.append(start_tag + "\n".join(ce_docs) + end_tag)
+
+    return prompt.render(query=query, examples=context, features=feat_values, counter_examples="".join(ce_examples))
 
 def get_BFI_prompts(dataset, text):
 
@@ -16,6 +16,7 @@ class Retriever:
         self.dataset = dataset
         self.save_loc = os.path.join("files", "retrieval_res")
         os.makedirs(self.save_loc, exist_ok=True)
+        self.ce_retr_res = None
         self._init_model()
 
     def _init_model(self):
@@ -78,10 +79,12 @@ class Retriever:
 
         queries, retr_texts, retr_gts = self.dataset.get_retr_data() 
         _, retr_gt_name, retr_prompt_name = self.dataset.get_var_names()
-        _, ce_retr_res = self.get_retrieval_results(queries, queries)
+        # Query-query similarities don't depend on the number of contrastive examples, so they are reused across calls.
+        if self.ce_retr_res is None:
+            _, self.ce_retr_res = self.get_retrieval_results(queries, queries)
 
         all_ce_examples = []
-        for ce_retr in ce_retr_res:
+        for ce_retr in self.ce_retr_res:
 
             ce_idxs = ce_retr[-num_ce:]
             ce_examples = []
@@ -1,159 +1,104 @@
 import os
 import time
-import json
 import sys
-import copy
 import torch 
 
 from AP_Bots.models import LLM
-from AP_Bots.prompts import prepare_res_prompt
-from AP_Bots.feature_processor import FeatureProcessor
-from AP_Bots.retriever import Retriever
 
-from AP_Bots.utils.argument_parser import parse_args
-from AP_Bots.utils.file_utils import oai_get_or_create_file
+from AP_Bots.utils.argument_parser import parse_args, parse_shard
+from AP_Bots.utils.file_utils import get_shard_range, get_shard_path, get_num_preds
+from AP_Bots.utils.pred_store import PredStore
+from AP_Bots.utils.batch_manager import BatchManager
+from AP_Bots.utils.prompt_store import PromptStore, prepare_exp_inputs
+from AP_Bots.utils.exp_utils import get_config_name, get_exp_name, get_max_new_tokens, get_model_params, open_pred_store, generate_preds, write_batch_file, estimate_exp, print_estimate
 from AP_Bots.utils.misc import get_model_list
 
 args, dataset, final_feature_list, k = parse_args()
-MAX_NEW_TOKENS = 64 if dataset.name == "lamp" else 128
 pred_path = os.path.join("files", "preds")
 os.makedirs(pred_path, exist_ok=True)
 
-if dataset.name == "lamp":
-    ids = dataset.get_ids()    
+ids = dataset.get_ids() if dataset.name == "lamp" else None
 
-LLMs = get_model_list()
-# LLMs = ["GPT-4o-mini"]
+LLMs = args.models if args.models else get_model_list()
 
-retriever = Retriever(dataset, args.retriever)
-all_context = retriever.get_context(k) 
-
-if args.features:
-    feature_processor = FeatureProcessor(dataset)
-    prepared_features = feature_processor.prepare_features(args.features)
-else:
-    features = None
-
-if args.counter_examples:
-    ce_k = 3 if k == 50 else 1
-    all_ce_examples = retriever.contrastive_retrieval(args.counter_examples, ce_k)
+config_name = get_config_name(dataset, final_feature_list, args.retriever, args.repetition_step, k)
+# Retrieval and features are only needed to build prompt stores that don't exist yet.
+exp_inputs = None
 
 queries, _, _ = dataset.get_retr_data() 
+task = f"LaMP_{dataset.num}" if dataset.name == "lamp" else dataset.tag
+
+if args.shard:
+    if args.openai_batch:
+        raise Exception("Batch openai jobs can't be sharded!")
+    shard_idx, num_shards = parse_shard(args.shard)
+    start_idx, end_idx = get_shard_range(len(queries), shard_idx, num_shards)
+    print(f"Running shard {shard_idx}/{num_shards} on samples {start_idx} to {end_idx}")
+else:
+    start_idx, end_idx = 0, len(queries)
 
 print(f"Running experiments for {dataset.tag} with Features: {final_feature_list}, Retriever: {args.retriever}, Repetition Step: {args.repetition_step} and K: {k}")
 sys.stdout.flush()
 
 for model_name in LLMs:
 
-    exp_name = f"{dataset.tag}_{model_name}_{final_feature_list}_{args.retriever}_RS({args.repetition_step})_K({k})"
+    exp_name = get_exp_name(dataset, model_name, final_feature_list, args.retriever, args.repetition_step, k)
     out_path = os.path.join(pred_path, f"{exp_name}.json")
 
-    if os.path.exists(out_path):
-        with open(out_path, "rb") as f:
-             all_res = json.load(f)["golds"]
+    if args.shard:
+        if get_num_preds(out_path) == len(queries):
+            print(model_name)
+            print("Shards for this LLM are already merged!")
+            continue
+        pred_store = PredStore(get_shard_path(pred_path, exp_name, shard_idx, num_shards))
     else:
-        all_res = []
+        pred_store = open_pred_store(pred_path, exp_name)
 
     print(model_name) 
-    if len(all_res) == len(queries):
+    if len(pred_store) == end_idx - start_idx:
+        if not args.shard and not os.path.exists(out_path):
+            pred_store.compact(out_path, task)
         print("Experiment for this LLM is already concluded!")
         continue
 
-    elif len(all_res) != 0 and args.openai_batch:
+    elif len(pred_store) != 0 and args.openai_batch:
         print("Batch openai jobs can only be done on the whole dataset!")
         continue
 
-    MAX_NEW_TOKENS = MAX_NEW_TOKENS * 20 if model_name.startswith("DEEPSEEK") else MAX_NEW_TOKENS
-    model_params = None
-    if model_name.endswith("70B"):
-        print("70B model, using quantization!")
-        model_params = {
-            "quantization": {
-                "load_in_4bit": True,
-                "bnb_4bit_compute_dtype": torch.float16,
-                "bnb_4bit_quant_type": "nf4",
-                "bnb_4bit_use_double_quant": True
-            }
-        }
-    
-    llm = LLM(model_name=model_name, model_params=model_params)
-
-    print(f"Starting from sample no. {len(all_res)}")
-
-    start_time = time.time()
-    sys.stdout.flush() 
-
-    cont_idx = copy.copy(len(all_res))
-
-    for _ in range(len(queries) - len(all_res)):
-        
-        query = queries[cont_idx]       
-        if dataset.name == "amazon":
-            query_rating, _ = dataset.get_ratings(cont_idx) 
-            query = f"{query}\nRating:\n{query_rating}"
-            
-        context = all_context[cont_idx]    
-
-        if args.features:
-            features = prepared_features[cont_idx]
-        
-        if args.counter_examples:
-            ce_examples = all_ce_examples[cont_idx]
-        else:
-            ce_examples = None
-
-        start_bot_time = time.time() 
-
-        prompt = prepare_res_prompt(dataset, query, llm, examples=context, features=features, counter_examples=ce_examples, repetition_step=args.repetition_step)
-        prompt = [{"role": "user", "content": prompt}]
-        id = ids[cont_idx] if dataset.name == "lamp" else cont_idx
-
-        if llm.family == "GPT" and args.openai_batch:
-
-            with open(os.path.join(pred_path, f"{exp_name}.jsonl"), "a+") as file:
-                        json_line = json.dumps({"custom_id": str(id), "method": "POST", "url": "/v1/chat/completions", 
-                                                "body": {"model": llm.repo_id, 
-                                                "messages": prompt, "max_tokens": MAX_NEW_TOKENS}})
-                        file.write(json_line + '\n')
-
-        else:
-
-            res = llm.generate(prompt, gen_params={"max_new_tokens": MAX_NEW_TOKENS})
-            end_bot_time = time.time()
-            all_res.append({
-                    "id": id,
-                    "output": res,
-                    "prompt": prompt,
-                    "model_inf_time": round(end_bot_time - start_bot_time, 2), 
-            })
-
-            if (cont_idx+1)%500==0 or (cont_idx+1)==len(queries):
-                print(cont_idx+1)
-                with open(out_path, "w") as f:
-                    task = f"LaMP_{dataset.num}" if dataset.name == "lamp" else dataset.tag          
-                    json.dump({
-                        "task": task,
-                        "golds": all_res
-                    }, f)
-
-        sys.stdout.flush()
-        cont_idx += 1 
-
-    if llm.family == "GPT" and args.openai_batch:
+    max_new_tokens = get_max_new_tokens(dataset, model_name)
+    llm = LLM(model_name=model_name, model_params=get_model_params(model_name), load_model=False)
+    prompt_store = PromptStore(config_name, llm)
+    if not prompt_store.exists():
+        if exp_inputs is None:
+            exp_inputs = prepare_exp_inputs(dataset, args, k)
+        prompt_store.build(dataset, exp_inputs, repetition_step=args.repetition_step, num_workers=args.prompt_workers)
 
-        print("Created batch job for the experiment!")
-        batch_input_file_id = oai_get_or_create_file(llm.model, os.path.join(pred_path, f"{exp_name}.jsonl"))
+    if args.dry_run:
 
-        llm.model.batches.create(
-            input_file_id=batch_input_file_id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h",
-        )       
+        prompt_tokens = [n_tokens for _, _, n_tokens in prompt_store.read(start_idx + len(pred_store), end_idx)]
+        est = estimate_exp(llm, prompt_tokens, max_new_tokens, pred_path, batch=args.openai_batch)
+        print_estimate(exp_name, est)
+
+    elif llm.family == "GPT" and args.openai_batch:
+
+        batch_path = os.path.join(pred_path, f"{exp_name}.jsonl")
+        write_batch_file(llm, prompt_store, ids, batch_path, max_new_tokens)
+        BatchManager(llm.model).submit(batch_path, out_path, kind="preds", task=task)
+        print("Created batch job for the experiment!")
 
     else:
 
+        llm.load()
+        print(f"Starting from sample no. {len(pred_store)}")
+        start_time = time.time()
+        sys.stdout.flush() 
+
+        generate_preds(llm, prompt_store, pred_store, ids, start_idx, end_idx, max_new_tokens)
+        if not args.shard:
+            pred_store.compact(out_path, task)
         end_time = time.time()
         print(f"Took {(end_time-start_time)/3600} hours!")
+        llm.shutdown()
         del llm
         llm = []
-        torch.cuda.empty_cache()
\ No newline at end of file
+        torch.cuda.empty_cache()
@@ -0,0 +1,61 @@
+import os
+import sys
+import subprocess
+
+from AP_Bots.utils.argument_parser import parse_args
+from AP_Bots.utils.file_utils import merge_shards, get_num_preds
+from AP_Bots.utils.misc import get_model_list
+from AP_Bots.utils.prompt_store import build_prompt_stores
+from AP_Bots.utils.exp_utils import get_config_name, get_exp_name
+
+args, dataset, final_feature_list, k = parse_args()
+num_workers = args.num_workers
+pred_path = os.path.join("files", "preds")
+
+LLMs = args.models if args.models else get_model_list()
+queries, _, _ = dataset.get_retr_data()
+task = f"LaMP_{dataset.num}" if dataset.name == "lamp" else dataset.tag
+
+if not args.merge_only:
+
+    # Workers would otherwise all compute the same retrieval results, features and prompts.
+    config_name = get_config_name(dataset, final_feature_list, args.retriever, args.repetition_step, k)
+    build_prompt_stores(dataset, args, k, config_name, LLMs)
+
+    worker_argv = []
+    skip_next = False
+    for arg in sys.argv[1:]:
+        if skip_next:
+            skip_next = False
+        elif arg in ["-nw", "--num_workers"]:
+            skip_next = True
+        elif arg.startswith("--num_workers=") or arg in ["-mo", "--merge_only", "--no-merge_only"]:
+            continue
+        else:
+            worker_argv.append(arg)
+
+    devices = os.getenv("CUDA_VISIBLE_DEVICES")
+    devices = devices.split(",") if devices else []
+
+    print(f"Launching {num_workers} workers for {dataset.tag} with Features: {final_feature_list}, Retriever: {args.retriever}, Repetition Step: {args.repetition_step} and K: {k}")
+    sys.stdout.flush()
+
+    workers = []
+    for shard_idx in range(num_workers):
+        env = os.environ.copy()
+        if devices:
+            env["CUDA_VISIBLE_DEVICES"] = devices[shard_idx % len(devices)]
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_exp.py"), *worker_argv, "-sh", f"{shard_idx}/{num_workers}"]
+        workers.append(subprocess.Popen(cmd, env=env))
+
+    failed = [shard_idx for shard_idx, worker in enumerate(workers) if worker.wait() != 0]
+    if failed:
+        print(f"Workers for shards {failed} failed, merging only the finished experiments!")
+
+for model_name in LLMs:
+
+    exp_name = get_exp_name(dataset, model_name, final_feature_list, args.retriever, args.repetition_step, k)
+    if get_num_preds(os.path.join(pred_path, f"{exp_name}.json")) == len(queries):
+        print(f"{exp_name} is already merged!")
+        continue
+    merge_shards(exp_name, num_workers, len(queries), task, pred_path)
@@ -0,0 +1,145 @@
+import os
+import sys
+import copy
+import json
+import time
+import itertools
+import torch
+
+from AP_Bots.models import LLM
+from AP_Bots.retriever import Retriever
+from AP_Bots.feature_processor import FeatureProcessor
+
+from AP_Bots.utils.argument_parser import get_args, parse_dataset, get_final_feature_list, get_k
+from AP_Bots.utils.file_utils import get_mean_inf_time
+from AP_Bots.utils.prompt_store import PromptStore, prepare_exp_inputs
+from AP_Bots.utils.exp_utils import get_config_name, get_exp_name, get_max_new_tokens, get_model_params, open_pred_store, generate_preds
+from AP_Bots.utils.misc import get_model_list
+
+# The sweep file lists the values of each axis, e.g.
+# {"datasets": ["lamp_5_dev_user"], "features": [null, ["DPF", "SP"]], "k": [-1], "counter_examples": [null, 3], "models": ["GEMMA-2-9B"]}
+args = get_args()
+with open(args.sweep, "r") as f:
+    sweep = json.load(f)
+
+pred_path = os.path.join("files", "preds")
+os.makedirs(pred_path, exist_ok=True)
+
+retriever_name = sweep.get("retriever", args.retriever)
+repetition_step = sweep.get("repetition_step", args.repetition_step)
+LLMs = sweep.get("models", args.models if args.models else get_model_list())
+cfg = LLM.get_cfg()
+# Smaller models run first so cheap results are available early.
+LLMs = sorted(LLMs, key=lambda model_name: float(cfg[model_name].get("min_GPU_RAM", 0)))
+
+cells = []
+datasets = {}
+for dataset_name in sweep["datasets"]:
+
+    dataset = parse_dataset(dataset_name)
+    queries, retr_texts, retr_gts = dataset.get_retr_data()
+    datasets[dataset.tag] = dataset
+
+    for features, top_k, counter_examples in itertools.product(sweep.get("features", [None]), sweep.get("k", [-1]), sweep.get("counter_examples", [None])):
+
+        cell_args = copy.copy(args)
+        cell_args.features = features if features else None
+        cell_args.counter_examples = counter_examples
+        cell_args.retriever = retriever_name
+        cell_args.repetition_step = repetition_step
+        k = get_k(retr_texts if dataset.name == "lamp" else retr_gts, dataset.name) if top_k == -1 else top_k
+        final_feature_list = get_final_feature_list(cell_args.features, counter_examples)
+
+        cells.append({
+            "dataset": dataset,
+            "args": cell_args,
+            "k": k,
+            "final_feature_list": final_feature_list,
+            "config_name": get_config_name(dataset, final_feature_list, retriever_name, repetition_step, k),
+            "num_samples": len(queries)
+        })
+
+pending = {model_name: [] for model_name in LLMs}
+for cell in cells:
+
+    dataset = cell["dataset"]
+    task = f"LaMP_{dataset.num}" if dataset.name == "lamp" else dataset.tag
+    for model_name in LLMs:
+
+        exp_name = get_exp_name(dataset, model_name, cell["final_feature_list"], retriever_name, repetition_step, cell["k"])
+        out_path = os.path.join(pred_path, f"{exp_name}.json")
+        pred_store = open_pred_store(pred_path, exp_name)
+        if len(pred_store) == cell["num_samples"]:
+            if not os.path.exists(out_path):
+                pred_store.compact(out_path, task)
+            continue
+        pending[model_name].append((cell, exp_name, out_path, task, pred_store))
+
+pending = {model_name: runs for model_name, runs in pending.items() if runs}
+if not pending:
+    print("All experiments in the sweep are already concluded!")
+    sys.exit(0)
+
+# Retrieval results and features are shared by every cell of a dataset, so they are computed once for
+# the union of the pending features.
+pending_tags = set(cell["dataset"].tag for runs in pending.values() for cell, *_ in runs)
+retrievers = {}
+for tag in pending_tags:
+    dataset = datasets[tag]
+    retrievers[tag] = Retriever(dataset, retriever_name)
+    union_features = set()
+    for cell in cells:
+        if cell["dataset"].tag == tag and cell["args"].features:
+            union_features.update(cell["args"].features)
+    if union_features:
+        FeatureProcessor(dataset, args.feature_workers).get_all_features(sorted(union_features))
+
+exp_inputs = {}
+for model_name, runs in pending.items():
+    llm = LLM(model_name=model_name, load_model=False)
+    for cell, *_ in runs:
+        prompt_store = PromptStore(cell["config_name"], llm)
+        if not prompt_store.exists():
+            if cell["config_name"] not in exp_inputs:
+                exp_inputs[cell["config_name"]] = prepare_exp_inputs(cell["dataset"], cell["args"], cell["k"], retriever=retrievers[cell["dataset"].tag])
+            prompt_store.build(cell["dataset"], exp_inputs[cell["config_name"]], repetition_step=repetition_step, num_workers=args.prompt_workers)
+exp_inputs = None
+
+print("Pending experiments:")
+total_est = 0
+for model_name, runs in pending.items():
+    num_remaining = sum(cell["num_samples"] - len(pred_store) for cell, *_, pred_store in runs)
+    mean_inf_time = get_mean_inf_time(model_name, pred_path)
+    if mean_inf_time is None:
+        print(f"{model_name}: {len(runs)} runs, {num_remaining} samples, no prior timings")
+    else:
+        total_est += num_remaining * mean_inf_time
+        print(f"{model_name}: {len(runs)} runs, {num_remaining} samples, ~{round(num_remaining * mean_inf_time / 3600, 2)} hours")
+print(f"Estimated total (models with prior timings): {round(total_est / 3600, 2)} hours")
+sys.stdout.flush()
+
+sweep_start = time.time()
+for model_name, runs in pending.items():
+
+    # Each model is loaded once and runs all of its pending cells.
+    llm = LLM(model_name=model_name, model_params=get_model_params(model_name), load_model=False)
+    llm.load()
+    start_time = time.time()
+
+    for cell, exp_name, out_path, task, pred_store in runs:
+
+        print(f"{exp_name}: starting from sample no. {len(pred_store)}")
+        sys.stdout.flush()
+        prompt_store = PromptStore(cell["config_name"], llm)
+        max_new_tokens = get_max_new_tokens(cell["dataset"], model_name)
+        ids = cell["dataset"].get_ids() if cell["dataset"].name == "lamp" else None
+        generate_preds(llm, prompt_store, pred_store, ids, 0, cell["num_samples"], max_new_tokens)
+        pred_store.compact(out_path, task)
+
+    print(f"{model_name} took {(time.time()-start_time)/3600} hours!")
+    llm.shutdown()
+    del llm
+    llm = []
+    torch.cuda.empty_cache()
+
+print(f"Sweep took {(time.time()-sweep_start)/3600} hours!")
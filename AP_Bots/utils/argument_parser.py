@@ -16,6 +16,17 @@ def get_args():
     parser.add_argument("-rs", "--repetition_step", default=1, type=int)
     parser.add_argument("-ob", "--openai_batch", default=False, action=argparse.BooleanOptionalAction)
     parser.add_argument("-ps", "--prompt_style", default="regular", type=str)
+    parser.add_argument("-m", "--models", nargs='+', type=str, default=None)
+    parser.add_argument("-bm", "--bfi_model", default="LLAMA-3.3-70B", type=str)
+    parser.add_argument("-sh", "--shard", default=None, type=str)
+    parser.add_argument("-nw", "--num_workers", default=1, type=int)
+    parser.add_argument("-mo", "--merge_only", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("-sw", "--sweep", default=None, type=str)
+    parser.add_argument("-dr", "--dry_run", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("-fw", "--feature_workers", default=1, type=int)
+    parser.add_argument("-ew", "--eval_workers", default=1, type=int)
+    parser.add_argument("-pw", "--prompt_workers", default=1, type=int)
+    parser.add_argument("-dl", "--download", default=False, action=argparse.BooleanOptionalAction)
 
     return parser.parse_args()
 
@@ -37,16 +48,9 @@ def parse_dataset(dataset):
 
 def parse_args():
 
-    final_feature_list = []
-
     args = get_args()
     dataset = parse_dataset(args.dataset)
-
-    if args.features:
-        final_feature_list = copy.copy(args.features)
-
-    if args.counter_examples:
-        final_feature_list.append(f"CE({args.counter_examples})")
+    final_feature_list = get_final_feature_list(args.features, args.counter_examples)
 
     _, retr_texts, retr_gts = dataset.get_retr_data()
     if args.top_k == -1:
@@ -56,6 +60,18 @@ def parse_args():
 
     return args, dataset, final_feature_list, k
 
+def get_final_feature_list(features, counter_examples):
+
+    final_feature_list = []
+
+    if features:
+        final_feature_list = copy.copy(features)
+
+    if counter_examples:
+        final_feature_list.append(f"CE({counter_examples})")
+
+    return final_feature_list
+
 def get_k(retr_texts, dataset_name):
 
     mean = []
@@ -68,4 +84,11 @@ def get_k(retr_texts, dataset_name):
         if dataset_name == "amazon":
             return 10
         else:
-            return 7
\ No newline at end of file
+            return 7
+
+def parse_shard(shard):
+
+    shard_idx, num_shards = [int(i) for i in shard.split("/")]
+    if not 0 <= shard_idx < num_shards:
+        raise Exception("Shard should be given as i/n with 0 <= i < n!")
+    return shard_idx, num_shards
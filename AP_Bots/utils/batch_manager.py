@@ -0,0 +1,250 @@
+import os
+import json
+import uuid
+from types import SimpleNamespace
+
+from AP_Bots.utils.file_utils import atomic_path
+
+
+class BatchManager:
+    """
+    Lifecycle of OpenAI batch jobs, tracked in a local state file.
+
+    Submitted jobs are recorded with their batch ids, so polling only retrieves the jobs that are still
+    pending instead of listing every batch and file of the account. Input files above the provider limits
+    are split into parts that are submitted as separate batches. Finished outputs are streamed to disk and
+    joined with the inputs by `custom_id`.
+
+    The client is injected, so anything exposing the `files` and `batches` calls used here (e.g.
+    `LocalBatchClient`) can stand in for `openai.OpenAI`.
+    """
+
+    TERMINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+
+    def __init__(self, client, state_path=os.path.join("files", "batches", "batch_state.json"), max_requests=50000, max_bytes=200 * 2**20):
+
+        self.client = client
+        self.state_path = state_path
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        self.state = self.load_state()
+
+    def load_state(self):
+
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def save_state(self):
+
+        with atomic_path(self.state_path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+
+    def split_file(self, batch_path):
+
+        if os.path.getsize(batch_path) <= self.max_bytes:
+            with open(batch_path, "rb") as f:
+                if sum(1 for _ in f) <= self.max_requests:
+                    return [batch_path]
+
+        parts = []
+        part_lines, part_bytes = [], 0
+        with open(batch_path, "rb") as f:
+            for line in f:
+                if part_lines and (len(part_lines) == self.max_requests or part_bytes + len(line) > self.max_bytes):
+                    parts.append(self.write_part(batch_path, len(parts), part_lines))
+                    part_lines, part_bytes = [], 0
+                part_lines.append(line)
+                part_bytes += len(line)
+        if part_lines:
+            parts.append(self.write_part(batch_path, len(parts), part_lines))
+
+        return parts
+
+    @staticmethod
+    def write_part(batch_path, part_idx, lines):
+
+        part_path = f"{batch_path[:-len('.jsonl')]}_part({part_idx}).jsonl"
+        with open(part_path, "wb") as f:
+            f.writelines(lines)
+        return part_path
+
+    def submit(self, batch_path, out_path, kind="preds", task=None, endpoint="/v1/chat/completions"):
+
+        job = self.state.get(batch_path)
+        if job and job["status"] != "failed":
+            print(f"Batch job for {batch_path} is already {job['status']}!")
+            return job
+
+        parts = []
+        for part_path in self.split_file(batch_path):
+            with open(part_path, "rb") as f:
+                input_file = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(input_file_id=input_file.id, endpoint=endpoint, completion_window="24h")
+            parts.append({"path": part_path, "input_file_id": input_file.id, "batch_id": batch.id, "status": batch.status, "output_file_id": None, "error_file_id": None})
+
+        print(f"Submitted {len(parts)} batch job(s) for {batch_path}")
+        self.state[batch_path] = {"out_path": out_path, "kind": kind, "task": task, "status": "pending", "parts": parts}
+        self.save_state()
+        return self.state[batch_path]
+
+    def poll(self):
+
+        for batch_path, job in self.state.items():
+
+            if job["status"] != "pending":
+                continue
+
+            for part in job["parts"]:
+                if part["status"] in self.TERMINAL_STATUSES:
+                    continue
+                batch = self.client.batches.retrieve(part["batch_id"])
+                part["status"] = batch.status
+                part["output_file_id"] = batch.output_file_id
+                part["error_file_id"] = getattr(batch, "error_file_id", None)
+
+                # A batch whose requests all failed completes without an output file, only with an error file.
+                if part["status"] == "completed" and part["output_file_id"] is None:
+                    part["status"] = "failed"
+                    if part["error_file_id"]:
+                        err_path = f"{part['path'][:-len('.jsonl')]}_err.jsonl"
+                        self.download(part["error_file_id"], err_path)
+                        print(f"Every request of {part['path']} failed, see {err_path}")
+
+            statuses = [part["status"] for part in job["parts"]]
+            if all(status == "completed" for status in statuses):
+                try:
+                    self.merge(batch_path, job)
+                    job["status"] = "completed"
+                except Exception as e:
+                    job["status"] = "failed"
+                    print(f"Merging the batch results of {batch_path} failed ({e}), resubmit it to retry!")
+            elif any(status in self.TERMINAL_STATUSES and status != "completed" for status in statuses):
+                job["status"] = "failed"
+                print(f"Batch job for {batch_path} ended with statuses {statuses}, resubmit it to retry!")
+            else:
+                print(f"Batch job for {batch_path} is still running: {statuses}")
+
+            # State is saved per job, so a failure in a later job doesn't lose the progress of earlier ones.
+            self.save_state()
+
+    def download(self, file_id, res_path):
+
+        with atomic_path(res_path) as tmp_path, self.client.files.with_streaming_response.content(file_id) as response:
+            response.stream_to_file(tmp_path)
+
+    def merge(self, batch_path, job):
+
+        outputs = {}
+        num_failed = 0
+        for part in job["parts"]:
+            res_path = f"{part['path'][:-len('.jsonl')]}_res.jsonl"
+            self.download(part["output_file_id"], res_path)
+            with open(res_path, "r") as f:
+                for line in f:
+                    res = json.loads(line)
+                    if res.get("response") and res["response"]["status_code"] == 200:
+                        outputs[res["custom_id"]] = res["response"]["body"]["choices"][0]["message"]["content"].strip()
+                    else:
+                        num_failed += 1
+
+        if num_failed:
+            print(f"{num_failed} requests of {batch_path} failed, their outputs are left empty!")
+
+        merged_res = []
+        with open(batch_path, "r") as f:
+            for line in f:
+                sample = json.loads(line)
+                output = outputs.get(sample["custom_id"], "")
+                if job["kind"] == "preds":
+                    merged_res.append({
+                        "id": sample["custom_id"],
+                        "prompt": sample["body"]["messages"][0]["content"],
+                        "output": output,
+                        "model_inf_time": "n/a",
+                    })
+                else:
+                    merged_res.append(output)
+
+        with atomic_path(job["out_path"]) as tmp_path, open(tmp_path, "w") as f:
+            if job["kind"] == "preds":
+                json.dump({"task": job["task"], "golds": merged_res}, f)
+            else:
+                json.dump(merged_res, f)
+        print(f"Merged batch results into {job['out_path']}")
+
+
+class LocalBatchClient:
+    """
+    In-process stand-in for the batch and file endpoints of the OpenAI client.
+
+    Batches finish after `polls_to_complete` retrievals, with each request answered by `responder`.
+    Files are kept in `save_loc`.
+    """
+
+    def __init__(self, save_loc, responder=None, polls_to_complete=1):
+
+        self.save_loc = save_loc
+        self.responder = responder if responder else lambda request: request["body"]["messages"][-1]["content"][:32]
+        self.polls_to_complete = polls_to_complete
+        self.batch_jobs = {}
+        os.makedirs(save_loc, exist_ok=True)
+
+        self.files = SimpleNamespace(
+            create=self.create_file,
+            with_streaming_response=SimpleNamespace(content=self.stream_file)
+        )
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch)
+
+    def create_file(self, file, purpose):
+
+        file_id = f"file-{uuid.uuid4().hex}"
+        with open(os.path.join(self.save_loc, file_id), "wb") as f:
+            f.write(file.read())
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def stream_file(self, file_id):
+
+        file_path = os.path.join(self.save_loc, file_id)
+
+        class Response:
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc):
+                return False
+            def stream_to_file(self, path):
+                with open(file_path, "rb") as src, open(path, "wb") as dst:
+                    while chunk := src.read(2**20):
+                        dst.write(chunk)
+
+        return Response()
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+
+        batch_id = f"batch-{uuid.uuid4().hex}"
+        self.batch_jobs[batch_id] = {"input_file_id": input_file_id, "polls": 0, "output_file_id": None}
+        return SimpleNamespace(id=batch_id, status="validating", output_file_id=None)
+
+    def retrieve_batch(self, batch_id):
+
+        job = self.batch_jobs[batch_id]
+        job["polls"] += 1
+        if job["polls"] < self.polls_to_complete:
+            return SimpleNamespace(id=batch_id, status="in_progress", output_file_id=None)
+
+        if job["output_file_id"] is None:
+            output_file_id = f"file-{uuid.uuid4().hex}"
+            with open(os.path.join(self.save_loc, job["input_file_id"]), "r") as src, open(os.path.join(self.save_loc, output_file_id), "w") as dst:
+                for line in src:
+                    request = json.loads(line)
+                    dst.write(json.dumps({
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": self.responder(request)}}]}},
+                        "error": None
+                    }) + "\n")
+            job["output_file_id"] = output_file_id
+
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=job["output_file_id"])
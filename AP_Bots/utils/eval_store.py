@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+from AP_Bots.utils.file_utils import atomic_path
+
+
+class EvalStore:
+    """
+    Per-sample evaluation scores of a dataset's prediction files.
+
+    Every score column of a run (e.g. rougeL or bleu_stats) is a separate .npy file read memory-mapped, so a
+    subset of runs and columns is loaded without touching the others. An index keeps the parameters of each run,
+    the content hash of the prediction file it was scored from and the version of each metric computed on it,
+    so only new or changed files, or metrics whose version changed, are scored again.
+    """
+
+    def __init__(self, tag, save_loc=os.path.join("evaluation", "files", "store")):
+
+        self.path = os.path.join(save_loc, tag)
+        self.index_path = os.path.join(self.path, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+
+    def exists(self):
+        return bool(self.index)
+
+    def get_runs(self):
+        return list(self.index.keys())
+
+    def get_params(self, run):
+        return self.index[run]["params"]
+
+    @staticmethod
+    def get_file_hash(path, chunk_size=2**20):
+
+        file_hash = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                file_hash.update(chunk)
+        return file_hash.hexdigest()
+
+    def get_stale_metrics(self, run, file_hash, metric_versions):
+
+        entry = self.index.get(run)
+        if entry is None or entry["hash"] != file_hash:
+            return list(metric_versions)
+        return [metric for metric, version in metric_versions.items() if entry["metrics"].get(metric) != version]
+
+    def is_current(self, run, pred_path, metric_versions):
+        """
+        Whether the stored scores of a run were computed from the current prediction file with the current metric versions.
+        """
+        return os.path.exists(pred_path) and not self.get_stale_metrics(run, self.get_file_hash(pred_path), metric_versions)
+
+    def save_index(self):
+
+        with atomic_path(self.index_path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+
+    def write(self, run, params, file_hash, scores, metric_versions):
+
+        entry = self.index.get(run)
+        if entry is None or entry["hash"] != file_hash:
+            # Scores of an older version of the prediction file are dropped with it.
+            shutil.rmtree(os.path.join(self.path, run), ignore_errors=True)
+            entry = {"params": params, "hash": file_hash, "metrics": {}, "columns": []}
+
+        os.makedirs(os.path.join(self.path, run), exist_ok=True)
+        for column, values in scores.items():
+            np.save(os.path.join(self.path, run, f"{column}.npy"), np.asarray(values))
+            if column not in entry["columns"]:
+                entry["columns"].append(column)
+
+        # The index is updated after the columns, so an interrupted write only causes the metrics to be scored again.
+        entry["metrics"] |= metric_versions
+        self.index[run] = entry
+        self.save_index()
+
+    def read(self, run, columns=None):
+
+        stored_columns = self.index[run]["columns"]
+        columns = stored_columns if columns is None else [column for column in columns if column in stored_columns]
+        return {column: np.load(os.path.join(self.path, run, f"{column}.npy"), mmap_mode="r") for column in columns}
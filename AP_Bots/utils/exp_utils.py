@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+from itertools import islice
+
+import torch
+
+from AP_Bots.utils.pred_store import PredStore
+from AP_Bots.utils.file_utils import get_log_path, get_prior_preds
+
+
+def get_config_name(dataset, final_feature_list, retriever, repetition_step, k):
+
+    return f"{dataset.tag}_{final_feature_list}_{retriever}_RS({repetition_step})_K({k})"
+
+def get_exp_name(dataset, model_name, final_feature_list, retriever, repetition_step, k):
+
+    return f"{dataset.tag}_{model_name}_{final_feature_list}_{retriever}_RS({repetition_step})_K({k})"
+
+def get_max_new_tokens(dataset, model_name):
+
+    max_new_tokens = 64 if dataset.name == "lamp" else 128
+    return max_new_tokens * 20 if model_name.startswith("DEEPSEEK") else max_new_tokens
+
+def get_model_params(model_name):
+
+    if model_name.endswith("70B"):
+        print("70B model, using quantization!")
+        return {
+            "quantization": {
+                "load_in_4bit": True,
+                "bnb_4bit_compute_dtype": torch.float16,
+                "bnb_4bit_quant_type": "nf4",
+                "bnb_4bit_use_double_quant": True
+            }
+        }
+    return None
+
+def open_pred_store(pred_path, exp_name):
+
+    pred_store = PredStore(get_log_path(pred_path, exp_name))
+    out_path = os.path.join(pred_path, f"{exp_name}.json")
+    # Partial JSON checkpoints from before the JSONL logs are imported once.
+    if len(pred_store) == 0 and os.path.exists(out_path):
+        pred_store.import_json(out_path)
+    return pred_store
+
+def generate_preds(llm, prompt_store, pred_store, ids, start_idx, end_idx, max_new_tokens, block_size=500):
+
+    cont_idx = start_idx + len(pred_store)
+    stored_prompts = prompt_store.read(cont_idx, end_idx)
+
+    while cont_idx < end_idx:
+
+        block_end = min(end_idx, (cont_idx // block_size + 1) * block_size)
+        block_prompts = {idx: [{"role": "user", "content": prompt}] for idx, prompt, _ in islice(stored_prompts, block_end - cont_idx)}
+
+        # llama.cpp reuses the KV state of the longest common prefix with the previous prompt,
+        # so generating the block in lexicographic prompt order maximises shared-prefix hits.
+        gen_order = list(block_prompts.keys())
+        if llm.provider == "GGUF":
+            gen_order = sorted(gen_order, key=lambda idx: block_prompts[idx][0]["content"])
+
+        # Results are appended in id order as soon as they form a contiguous run, so the log can be resumed
+        # by counting its lines even when the block is generated out of order.
+        block_res = {}
+        next_idx = cont_idx
+        for idx in gen_order:
+
+            prompt = block_prompts[idx]
+            start_bot_time = time.time() 
+            res = llm.generate(prompt, gen_params={"max_new_tokens": max_new_tokens})
+            end_bot_time = time.time()
+            block_res[idx] = {
+                    "id": ids[idx] if ids else idx,
+                    "output": res,
+                    "prompt": prompt,
+                    "model_inf_time": round(end_bot_time - start_bot_time, 2), 
+            }
+            while next_idx in block_res:
+                pred_store.append(block_res.pop(next_idx))
+                next_idx += 1
+
+            sys.stdout.flush()
+
+        print(block_end)
+        cont_idx = block_end
+
+    pred_store.close()
+    if llm.provider == "GGUF":
+        prefix_stats = llm.get_prefix_stats()
+        print(f"Prefix hit rate: {prefix_stats['hit_rate']}, prompt-eval tokens saved: {prefix_stats['reused_tokens']}/{prefix_stats['prompt_tokens']} ({prefix_stats['saved_ratio']})")
+
+def write_batch_file(llm, prompt_store, ids, batch_path, max_new_tokens):
+
+    with open(batch_path, "w") as file:
+        for idx, prompt, _ in prompt_store.read():
+            json_line = json.dumps({"custom_id": str(ids[idx] if ids else idx), "method": "POST", "url": "/v1/chat/completions", 
+                                    "body": {"model": llm.repo_id, 
+                                    "messages": [{"role": "user", "content": prompt}], "max_tokens": max_new_tokens}})
+            file.write(json_line + '\n')
+
+def estimate_exp(llm, prompt_tokens, max_new_tokens, pred_path=os.path.join("files", "preds"), batch=False, max_prior_preds=1000):
+
+    num_samples = len(prompt_tokens)
+    est = {
+        "samples": num_samples,
+        "input_tokens": sum(prompt_tokens),
+        "max_output_tokens": num_samples * max_new_tokens,
+        "output_tokens": num_samples * max_new_tokens,
+        "tokens_per_sec": None,
+        "hours": None,
+        "cost": None
+    }
+
+    # A bounded sample of earlier predictions of the model gives its typical output length and decoding throughput.
+    # Tokens are counted locally, so a dry run never calls a provider's token counting API.
+    prior_preds = list(islice(get_prior_preds(llm.model_name, pred_path), max_prior_preds))
+    prior_out_tokens = [min(num_tokens, max_new_tokens) for num_tokens in llm.count_local_tokens([str(pred["output"]) for pred in prior_preds])]
+    prior_inf_times = [pred["model_inf_time"] for pred in prior_preds]
+
+    if prior_inf_times:
+        est["output_tokens"] = round(num_samples * sum(prior_out_tokens) / len(prior_out_tokens))
+        est["tokens_per_sec"] = round(sum(prior_out_tokens) / sum(prior_inf_times), 2)
+        est["hours"] = round(num_samples * sum(prior_inf_times) / len(prior_inf_times) / 3600, 2)
+
+    # Prices in the model config are in USD per million tokens, OpenAI batch jobs are billed at half price.
+    if "input_price" in llm.cfg:
+        cost = (est["input_tokens"] * float(llm.cfg["input_price"]) + est["output_tokens"] * float(llm.cfg["output_price"])) / 1e6
+        est["cost"] = round(cost * 0.5 if batch else cost, 2)
+
+    return est
+
+def print_estimate(name, est):
+
+    print(f"{name}: {est['samples']} samples, {est['input_tokens']} input tokens, {est['output_tokens']} output tokens (max {est['max_output_tokens']})")
+    if est["hours"] is not None:
+        print(f"Throughput: {est['tokens_per_sec']} tokens/s, wall time: ~{est['hours']} hours")
+    else:
+        print("No prior predictions for this model, wall time can't be estimated!")
+    if est["cost"] is not None:
+        print(f"API cost: ~${est['cost']}")
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from AP_Bots.utils.vocab import Vocab
+from AP_Bots.utils.file_utils import atomic_path
+from AP_Bots.utils.nlp_utils import FREQ_TOP_N
+
+
+class FeatureStore:
+    """
+    Per-author features of a dataset, stored as one column per feature.
+
+    Numeric features are float arrays and frequency features are top-N arrays of ids into a per-feature
+    vocabulary with their percentages, both saved as .npy files and read memory-mapped, so only the
+    requested columns and rows are loaded. Any other feature (e.g. BFI) is kept as a JSON list. Columns are
+    written independently, so adding a feature doesn't rewrite the others. Each column can keep the
+    fingerprints of the author texts it was computed from, so changed authors can be detected.
+    """
+
+    def __init__(self, name, save_loc=os.path.join("files", "features"), top_n=FREQ_TOP_N):
+
+        self.path = os.path.join(save_loc, name)
+        self.top_n = top_n
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, feature, suffix):
+        return os.path.join(self.path, f"{feature}{suffix}")
+
+    def has(self, feature):
+        return any(os.path.exists(self.get_path(feature, suffix)) for suffix in [".npy", "_ids.npy", ".json"])
+
+    @staticmethod
+    def save_atomic(path, obj):
+
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb" if isinstance(obj, np.ndarray) else "w") as f:
+            if isinstance(obj, np.ndarray):
+                np.save(f, obj)
+            else:
+                json.dump(obj, f)
+
+    @staticmethod
+    def get_fingerprint(texts):
+        return hashlib.md5(json.dumps(texts).encode()).hexdigest()
+
+    def read_fingerprints(self, feature):
+
+        if not os.path.exists(self.get_path(feature, "_fp.json")):
+            return None
+        with open(self.get_path(feature, "_fp.json"), "r") as f:
+            return json.load(f)
+
+    def write_fingerprints(self, feature, fingerprints):
+        self.save_atomic(self.get_path(feature, "_fp.json"), fingerprints)
+
+    def write(self, feature, values, fingerprints=None):
+
+        first = next((value for value in values if value not in (None, [])), None)
+
+        if isinstance(first, (int, float)):
+            self.save_atomic(self.get_path(feature, ".npy"), np.asarray(values, dtype=np.float64))
+
+        elif isinstance(first, list) and all(isinstance(item, (list, tuple)) and len(item) == 2 for item in first):
+            vocab = Vocab()
+            ids = np.full((len(values), self.top_n), -1, dtype=np.int32)
+            freqs = np.zeros((len(values), self.top_n), dtype=np.float32)
+            for i, value in enumerate(values):
+                for j, (key, freq) in enumerate(value[:self.top_n]):
+                    ids[i, j] = vocab.add(key)
+                    freqs[i, j] = freq
+            vocab.save(self.get_path(feature, "_vocab.json"))
+            self.save_atomic(self.get_path(feature, "_freqs.npy"), freqs)
+            self.save_atomic(self.get_path(feature, "_ids.npy"), ids)
+
+        else:
+            self.save_atomic(self.get_path(feature, ".json"), values)
+
+        # Fingerprints are written after the column, so an interrupted write never marks stale values as current.
+        if fingerprints is not None:
+            self.write_fingerprints(feature, fingerprints)
+
+    def read(self, feature, rows=None, top_k=None):
+
+        rows = slice(None) if rows is None else rows
+
+        if os.path.exists(self.get_path(feature, ".npy")):
+            return np.load(self.get_path(feature, ".npy"), mmap_mode="r")[rows]
+
+        elif os.path.exists(self.get_path(feature, "_ids.npy")):
+            with open(self.get_path(feature, "_vocab.json"), "r") as f:
+                vocab = json.load(f)
+            ids = np.load(self.get_path(feature, "_ids.npy"), mmap_mode="r")[rows, :top_k]
+            freqs = np.load(self.get_path(feature, "_freqs.npy"), mmap_mode="r")[rows, :top_k]
+            return [[(vocab[key_id], round(float(freq), 3)) for key_id, freq in zip(row_ids, row_freqs) if key_id != -1]
+                    for row_ids, row_freqs in zip(ids, freqs)]
+
+        else:
+            with open(self.get_path(feature, ".json"), "r") as f:
+                values = json.load(f)
+            return values[rows] if isinstance(rows, slice) else [values[i] for i in rows]
+
+    def import_json(self, json_path, feature_list):
+
+        with open(json_path, "r") as f:
+            author_features = json.load(f)
+        for feature in feature_list:
+            if feature in author_features and not self.has(feature):
+                print(f"Importing {feature} from {json_path}")
+                self.write(feature, author_features[feature])
@@ -2,6 +2,22 @@ import os
 import random
 import json
 import re
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_path(path, suffix=".tmp"):
+    """
+    Yields a temporary path to write instead of path, which replaces path only once the block finishes,
+    so readers never see a partially written file.
+    """
+
+    tmp_path = f"{path}{suffix}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def list_files_in_directory(root_dir):
 
@@ -45,56 +61,66 @@ def parse_filename(file, dataset_tag):
 
     return {"model": model, "retriever": retriever, "features": features, "RS": rs, "k": k, "PS": ps}
 
-def oai_get_or_create_file(client, filename):
+def get_num_preds(path):
 
-    files = client.files.list()
-    existing_file = next((file for file in files if file.filename == filename), None)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
+        return len(json.load(f)["golds"])
 
-    if existing_file:
-        print(f"File '{filename}' already exists. File ID: {existing_file.id}")
-        return existing_file.id
-    else:
-        with open(filename, "rb") as file_data:
-            new_file = client.files.create(
-                file=file_data,
-                purpose="batch"
-            )
-        print(f"File '{filename}' created. File ID: {new_file.id}")
-        return new_file.id
-    
-def oai_get_batch_res(client, pred_path=os.path.join("files", "preds")):
-
-    batches = client.batches.list()
-    files = client.files.list()
-
-    for batch in batches:
-        
-        filename = [file.filename for file in files if file.id == batch.input_file_id]
-
-        if filename and batch.output_file_id:
-
-            merged_res = []
-            path_to_file = os.path.join(pred_path, filename[0])
-
-            if os.path.exists(path_to_file):
-                data = []
-                
-                with open(path_to_file, "r") as f:
-                    for line in f:
-                        data.append(json.loads(line.strip()))
-                batch_res = client.files.content(batch.output_file_id).text
-                batch_res = [json.loads(line) for line in batch_res.splitlines()]
-
-                if pred_path == os.path.join("files", "preds"):
-                    for sample in data:
-                        res = [res["response"]["body"]["choices"][0]["message"]["content"] for res in batch_res if res["custom_id"] == sample["custom_id"]]
-                        merged_res.append({
-                            "id": sample["custom_id"],
-                            "prompt": sample["body"]["messages"][0]["content"],
-                            "output": res[0].strip(),
-                            "model_inf_time": "n/a", 
-                    })
-                    with open(os.path.join(pred_path, f"{filename[0].split('.')[0]}.json"), "w") as f:
-                        json.dump({
-                            "golds": merged_res
-                        }, f)
\ No newline at end of file
+def get_shard_range(num_samples, shard_idx, num_shards):
+
+    return num_samples*shard_idx//num_shards, num_samples*(shard_idx+1)//num_shards
+
+def get_log_path(pred_path, exp_name):
+
+    return os.path.join(pred_path, "logs", f"{exp_name}.jsonl")
+
+def get_shard_path(pred_path, exp_name, shard_idx, num_shards):
+
+    return os.path.join(pred_path, "shards", f"{exp_name}_shard({shard_idx}-{num_shards}).jsonl")
+
+def merge_shards(exp_name, num_shards, num_samples, task, pred_path=os.path.join("files", "preds")):
+
+    # PredStore writes through atomic_path, so it is imported here to avoid a circular import.
+    from AP_Bots.utils.pred_store import PredStore
+
+    shard_stores = []
+    for shard_idx in range(num_shards):
+
+        start, end = get_shard_range(num_samples, shard_idx, num_shards)
+        shard_path = get_shard_path(pred_path, exp_name, shard_idx, num_shards)
+        if not os.path.exists(shard_path):
+            print(f"Shard {shard_idx}/{num_shards} of {exp_name} doesn't exist!")
+            return False
+
+        shard_store = PredStore(shard_path)
+        if len(shard_store) != end - start:
+            print(f"Shard {shard_idx}/{num_shards} of {exp_name} is not finished yet!")
+            return False
+        shard_stores.append(shard_store)
+
+    with open(os.path.join(pred_path, f"{exp_name}.json"), "w") as f:
+        json.dump({
+            "task": task,
+            "golds": [record for shard_store in shard_stores for record in shard_store.read()]
+        }, f)
+    print(f"Merged {num_shards} shards into {exp_name}.json")
+    return True
+
+def get_prior_preds(model_name, pred_path=os.path.join("files", "preds"), max_files=5):
+
+    num_files = 0
+    for file in os.listdir(pred_path):
+        if f"_{model_name}_[" in file and file.endswith(".json") and num_files < max_files:
+            with open(os.path.join(pred_path, file), "r") as f:
+                preds = json.load(f)["golds"]
+            for pred in preds:
+                if isinstance(pred.get("model_inf_time"), (int, float)) and pred["model_inf_time"] > 0:
+                    yield pred
+            num_files += 1
+
+def get_mean_inf_time(model_name, pred_path=os.path.join("files", "preds"), max_files=5):
+
+    inf_times = [pred["model_inf_time"] for pred in get_prior_preds(model_name, pred_path, max_files)]
+    return sum(inf_times)/len(inf_times) if inf_times else None
@@ -0,0 +1,34 @@
+import os
+
+import nltk
+
+# NLTK data and the spaCy model are read from this directory first, so workers never need the network.
+NLP_RESOURCE_DIR = os.getenv("NLP_RESOURCE_DIR", os.path.join("files", "nlp_resources"))
+# Newer NLTK versions use the punkt_tab and _eng resources, either one of each entry is enough.
+NLTK_RESOURCES = {
+    "punkt": ["tokenizers/punkt_tab", "tokenizers/punkt"],
+    "stopwords": ["corpora/stopwords"],
+    "averaged_perceptron_tagger": ["taggers/averaged_perceptron_tagger_eng", "taggers/averaged_perceptron_tagger"],
+    "wordnet": ["corpora/wordnet"],
+    "omw-1.4": ["corpora/omw-1.4"]
+}
+
+nltk_ready = False
+
+
+def init_nltk():
+
+    global nltk_ready
+    if not nltk_ready:
+        if NLP_RESOURCE_DIR not in nltk.data.path:
+            nltk.data.path.insert(0, NLP_RESOURCE_DIR)
+        nltk_ready = True
+
+
+def has_nltk_resource(path):
+
+    try:
+        nltk.data.find(path)
+        return True
+    except LookupError:
+        return False
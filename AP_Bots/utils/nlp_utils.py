@@ -0,0 +1,220 @@
+import os
+import heapq
+from collections import Counter
+
+import numpy as np
+import nltk
+from nltk.tokenize import word_tokenize
+from nltk import pos_tag
+from nltk.corpus import stopwords
+
+from AP_Bots.utils.vocab import Vocab
+from AP_Bots.utils.nlp_resources import NLP_RESOURCE_DIR, NLTK_RESOURCES, init_nltk, has_nltk_resource
+
+# spaCy, torch, transformers and VADER are imported by the functions that use them, so importing this
+# module (e.g. from evaluation workers) stays cheap.
+
+SPACY_MODEL = "en_core_web_sm"
+# Pipeline components needed by each spaCy-backed statistic, tok2vec is shared by all of them.
+SPACY_COMPONENTS = {
+    "NEF": ["ner"],
+    "DPF": ["parser"]
+}
+
+# NLTK tag prefixes counted by the POS-ratio features.
+POS_PREFIXES = {
+    "ADVU": "RB",
+    "ADJU": "JJ",
+    "PU": "PRP"
+}
+
+# Only the most frequent items of the frequency features are kept.
+FREQ_TOP_N = 100
+
+# Default model of the transformers sentiment-analysis pipeline.
+BERT_SENTIMENT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+
+spacy_nlp = None
+stop_words = None
+vader_analyzer = None
+bert_pipelines = {}
+
+
+def get_spacy_nlp():
+
+    global spacy_nlp
+    if spacy_nlp is None:
+        import spacy
+        model_path = os.path.join(NLP_RESOURCE_DIR, SPACY_MODEL)
+        spacy_nlp = spacy.load(model_path if os.path.isdir(model_path) else SPACY_MODEL, disable=["lemmatizer"])
+    return spacy_nlp
+
+
+def is_hf_cached(repo_id):
+
+    from huggingface_hub import try_to_load_from_cache
+    return isinstance(try_to_load_from_cache(repo_id, "config.json"), str)
+
+
+def get_missing_resources():
+
+    import spacy
+
+    init_nltk()
+    missing = [f"nltk:{name}" for name, paths in NLTK_RESOURCES.items() if not any(has_nltk_resource(path) for path in paths)]
+    if not os.path.isdir(os.path.join(NLP_RESOURCE_DIR, SPACY_MODEL)) and not spacy.util.is_package(SPACY_MODEL):
+        missing.append(f"spacy:{SPACY_MODEL}")
+    if not is_hf_cached(BERT_SENTIMENT_MODEL):
+        missing.append(f"hf:{BERT_SENTIMENT_MODEL}")
+    return missing
+
+
+def download_nlp_resources():
+
+    import spacy
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    os.makedirs(NLP_RESOURCE_DIR, exist_ok=True)
+    for paths in NLTK_RESOURCES.values():
+        for path in paths:
+            nltk.download(path.split("/")[-1], download_dir=NLP_RESOURCE_DIR, quiet=True)
+
+    model_path = os.path.join(NLP_RESOURCE_DIR, SPACY_MODEL)
+    if not os.path.isdir(model_path):
+        if not spacy.util.is_package(SPACY_MODEL):
+            spacy.cli.download(SPACY_MODEL)
+        spacy.load(SPACY_MODEL).to_disk(model_path)
+
+    AutoTokenizer.from_pretrained(BERT_SENTIMENT_MODEL)
+    AutoModelForSequenceClassification.from_pretrained(BERT_SENTIMENT_MODEL)
+
+
+def get_disabled_pipes(nlp, features):
+
+    needed = {"tok2vec"} | {component for feature in features for component in SPACY_COMPONENTS[feature]}
+    return [name for name in nlp.pipe_names if name not in needed]
+
+
+def get_stop_words():
+
+    global stop_words
+    if stop_words is None:
+        init_nltk()
+        stop_words = set(stopwords.words('english'))
+    return stop_words
+
+
+def get_sorted_freqs(counter, top_n=FREQ_TOP_N, precision=2):
+
+    # A heap selects the top-n items without sorting every distinct item, ties keep their first-seen order.
+    total = sum(counter.values())
+    top_items = heapq.nlargest(top_n, counter.items(), key=lambda item: item[1])
+    return [(key, round((count / total) * 100, precision)) for key, count in top_items]
+
+
+def get_word_freqs(texts, top_n=FREQ_TOP_N):
+
+    stop_set = get_stop_words()
+    init_nltk()
+    # Words are interned in a per-author vocabulary in first-seen order and counted with one bincount. A stable
+    # sort on the counts keeps ties in first-seen order, as get_sorted_freqs does.
+    vocab = Vocab()
+    word_ids = vocab.encode(word for text in texts for word in word_tokenize(text.lower()) if word.isalpha() and word not in stop_set)
+    counts = vocab.count(word_ids)
+    top_ids = np.argsort(-counts, kind="stable")[:top_n]
+    return [(vocab.tokens[i], round((int(counts[i]) / len(word_ids)) * 100, 3)) for i in top_ids]
+
+
+def get_spacy_features(author_texts, features, batch_size=16):
+    """
+    Parses each author's concatenated texts once and collects every requested statistic from that parse:
+    NEF (named entity frequencies) and DPF (dependency pattern frequencies). Components no requested
+    statistic needs are disabled.
+    """
+
+    nlp = get_spacy_nlp()
+    res = {feature: [] for feature in features}
+
+    with nlp.select_pipes(disable=get_disabled_pipes(nlp, features)):
+        docs = nlp.pipe((" ".join(texts) for texts in author_texts), batch_size=batch_size)
+        for doc in docs:
+            if "NEF" in features:
+                res["NEF"].append(get_sorted_freqs(Counter((ent.text, ent.label_) for ent in doc.ents)))
+            if "DPF" in features:
+                res["DPF"].append(get_sorted_freqs(Counter((token.text, token.dep_) for token in doc)))
+
+    return res
+
+
+def get_pos_ratios(text, features=POS_PREFIXES):
+    """
+    Percentages of the requested POS_PREFIXES tags in a text, all from a single tagging of the text.
+    """
+
+    init_nltk()
+    words = word_tokenize(text.lower())
+    tags = [pos for _, pos in pos_tag(words)]
+    return {
+        feature: round((sum(tag.startswith(POS_PREFIXES[feature]) for tag in tags) / len(words)) * 100, 2) if words else 0
+        for feature in features
+    }
+
+
+def get_profile_pos_ratios(texts, features=POS_PREFIXES):
+    """
+    POS ratios of an author profile averaged over its texts. Each text is tagged once for every requested feature.
+    """
+
+    text_ratios = [get_pos_ratios(text, features) for text in texts]
+    return {feature: float(np.mean([ratios[feature] for ratios in text_ratios])) for feature in features}
+
+
+def get_vader_analyzer():
+
+    global vader_analyzer
+    if vader_analyzer is None:
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        vader_analyzer = SentimentIntensityAnalyzer()
+    return vader_analyzer
+
+
+def get_vader_scores(texts):
+
+    analyzer = get_vader_analyzer()
+    return [analyzer.polarity_scores(text) for text in texts]
+
+
+def get_bert_pipeline(backend="torch"):
+    """
+    Sentiment pipeline, created once per process and backend. "quantized" applies dynamic int8
+    quantization to the linear layers for CPU inference and "onnx" runs the model exported with
+    optimum's ONNX Runtime backend, which has to be installed separately.
+    """
+
+    if backend not in bert_pipelines:
+
+        import torch
+        from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+
+        # A cached model is loaded without any hub requests, so air-gapped workers don't stall on retries.
+        local_files_only = is_hf_cached(BERT_SENTIMENT_MODEL)
+        tokenizer = AutoTokenizer.from_pretrained(BERT_SENTIMENT_MODEL, local_files_only=local_files_only)
+        if backend == "onnx":
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            model = ORTModelForSequenceClassification.from_pretrained(BERT_SENTIMENT_MODEL, export=True, local_files_only=local_files_only)
+        elif backend == "quantized":
+            model = AutoModelForSequenceClassification.from_pretrained(BERT_SENTIMENT_MODEL, local_files_only=local_files_only)
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "torch":
+            model = AutoModelForSequenceClassification.from_pretrained(BERT_SENTIMENT_MODEL, local_files_only=local_files_only)
+        else:
+            raise Exception(f"Unknown sentiment backend: {backend}!")
+
+        bert_pipelines[backend] = pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+
+    return bert_pipelines[backend]
+
+
+def get_bert_scores(texts, batch_size=32, backend="torch"):
+
+    return get_bert_pipeline(backend)(texts, batch_size=batch_size, truncation=True)
@@ -0,0 +1,106 @@
+import os
+import json
+
+from AP_Bots.utils.file_utils import atomic_path
+
+
+class PredStore:
+    """
+    Append-only prediction log that keeps one JSON record per line.
+
+    Every record is flushed when it is appended and the file is fsynced every `fsync_step` records, so a
+    crash loses at most the records since the last fsync. A partial trailing line left by a crash is
+    truncated on open, after which resuming only needs the number of valid lines.
+    """
+
+    def __init__(self, path, fsync_step=16):
+
+        self.path = path
+        self.fsync_step = fsync_step
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.num_records = self.recover()
+        self.num_unsynced = 0
+        self.file = None
+
+    def __len__(self):
+        return self.num_records
+
+    def recover(self):
+
+        if not os.path.exists(self.path):
+            return 0
+
+        num_records = 0
+        valid_end = 0
+        last_line = None
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                num_records += 1
+                valid_end += len(line)
+                last_line = line
+
+        # Records are written with a single write call, so only the last line can be corrupt.
+        if last_line is not None:
+            try:
+                json.loads(last_line)
+            except json.JSONDecodeError:
+                num_records -= 1
+                valid_end -= len(last_line)
+
+        if valid_end != os.path.getsize(self.path):
+            print(f"Truncating a partial record at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+
+        return num_records
+
+    def append(self, record):
+
+        if self.file is None:
+            self.file = open(self.path, "a")
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.num_records += 1
+        self.num_unsynced += 1
+        if self.num_unsynced >= self.fsync_step:
+            self.sync()
+
+    def sync(self):
+
+        if self.file is not None and self.num_unsynced:
+            os.fsync(self.file.fileno())
+            self.num_unsynced = 0
+
+    def close(self):
+
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def read(self):
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for _, line in zip(range(self.num_records), f):
+                yield json.loads(line)
+
+    def import_json(self, json_path):
+
+        with open(json_path, "r") as f:
+            records = json.load(f)["golds"]
+        for record in records:
+            self.append(record)
+        self.sync()
+        print(f"Imported {len(records)} predictions from {json_path}")
+
+    def compact(self, out_path, task):
+
+        with atomic_path(out_path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({
+                "task": task,
+                "golds": list(self.read())
+            }, f)
@@ -0,0 +1,116 @@
+import os
+import copy
+import gzip
+import json
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from AP_Bots.models import LLM
+from AP_Bots.prompts import prepare_res_prompt, get_prompt_style
+from AP_Bots.feature_processor import FeatureProcessor
+from AP_Bots.retriever import Retriever
+from AP_Bots.utils.file_utils import atomic_path
+
+worker_llm = None
+
+
+def init_worker(model_name, gen_params):
+
+    global worker_llm
+    worker_llm = LLM(model_name, gen_params=gen_params, load_model=False)
+
+
+def build_chunk(dataset, samples, repetition_step):
+
+    records = []
+    for idx, query, context, features, ce_examples in samples:
+        prompt = prepare_res_prompt(dataset, query, worker_llm, examples=context, features=features, counter_examples=ce_examples, repetition_step=repetition_step)
+        records.append({"idx": idx, "prompt": prompt, "n_tokens": worker_llm.count_tokens(prompt, local=True)})
+    return records
+
+
+def prepare_exp_inputs(dataset, args, k, retriever=None):
+
+    queries, _, _ = dataset.get_retr_data()
+    if dataset.name == "amazon":
+        queries = [f"{query}\nRating:\n{dataset.get_ratings(i)[0]}" for i, query in enumerate(queries)]
+
+    if retriever is None:
+        retriever = Retriever(dataset, args.retriever)
+    all_context = retriever.get_context(k)
+
+    if args.features:
+        all_features = FeatureProcessor(dataset, args.feature_workers).prepare_features(args.features)
+    else:
+        all_features = [None] * len(queries)
+
+    if args.counter_examples:
+        ce_k = 3 if k == 50 else 1
+        all_ce_examples = retriever.contrastive_retrieval(args.counter_examples, ce_k)
+    else:
+        all_ce_examples = [None] * len(queries)
+
+    return queries, all_context, all_features, all_ce_examples
+
+
+class PromptStore:
+    """
+    Rendered prompts of an experiment configuration for one tokenizer family.
+
+    Prompts only depend on the model through its tokenizer, context length and generation budget, so
+    models sharing those read the same gzipped JSONL file. Each line holds the sample index, the prompt
+    and its token count.
+    """
+
+    def __init__(self, config_name, llm, save_loc=os.path.join("files", "prompts")):
+
+        self.llm = llm
+        self.path = os.path.join(save_loc, config_name, f"{llm.get_tokenizer_key()}_PS({get_prompt_style(llm)}).jsonl.gz")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def build(self, dataset, exp_inputs, repetition_step=1, num_workers=1, chunk_size=256):
+
+        samples = list(zip(range(len(exp_inputs[0])), *exp_inputs))
+        chunks = [samples[i:i+chunk_size] for i in range(0, len(samples), chunk_size)]
+        # Workers only need the dataset name and number, not the loaded samples.
+        light_dataset = copy.copy(dataset)
+        light_dataset.dataset = None
+
+        print(f"Building {len(samples)} prompts for {self.llm.model_name} in {self.path}")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with atomic_path(self.path, suffix=f".{os.getpid()}.tmp") as tmp_path, gzip.open(tmp_path, "wt") as f:
+            if num_workers > 1:
+                # Each worker builds its own LLM (tokenizer and clients), so the pool is kept small.
+                with ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, initargs=(self.llm.model_name, self.llm.gen_params)) as executor:
+                    for records in executor.map(build_chunk, [light_dataset]*len(chunks), chunks, [repetition_step]*len(chunks)):
+                        for record in records:
+                            f.write(json.dumps(record) + "\n")
+            else:
+                global worker_llm
+                worker_llm = self.llm
+                for chunk in chunks:
+                    for record in build_chunk(light_dataset, chunk, repetition_step):
+                        f.write(json.dumps(record) + "\n")
+
+    def read(self, start=0, end=None):
+
+        with gzip.open(self.path, "rt") as f:
+            for line in islice(f, start, end):
+                record = json.loads(line)
+                yield record["idx"], record["prompt"], record["n_tokens"]
+
+
+def build_prompt_stores(dataset, args, k, config_name, model_names):
+
+    exp_inputs = None
+    for model_name in model_names:
+        prompt_store = PromptStore(config_name, LLM(model_name, load_model=False))
+        if prompt_store.exists():
+            print(f"Prompts for {model_name} already exist in {prompt_store.path}")
+            continue
+        if exp_inputs is None:
+            exp_inputs = prepare_exp_inputs(dataset, args, k)
+        prompt_store.build(dataset, exp_inputs, repetition_step=args.repetition_step, num_workers=args.prompt_workers)
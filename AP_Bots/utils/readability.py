@@ -0,0 +1,96 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import textstat
+from textblob.sentiments import PatternAnalyzer
+
+# Sentence split, word count and SMOG constants follow textstat's defaults, so scores match textstat.smog_index.
+SENTENCE_RE = re.compile(r"\b[^.!?]+[.!?]*", re.UNICODE)
+APOSTROPHE_RE = re.compile(r"\'(?![tsd]\b|ve\b|ll\b|re\b)")
+PUNCTUATION_RE = re.compile(r"[^\w\s\']")
+READABILITY_FEATURES = ["MSWC", "SMOG"]
+SENTIMENT_FEATURES = ["SP", "SUBJ"]
+
+sentiment_analyzer = None
+
+
+@lru_cache(maxsize=2**18)
+def count_syllables(word):
+    return textstat.syllable_count(word)
+
+
+def count_lexicon(text):
+
+    # Like textstat.lexicon_count: punctuation, and apostrophes that aren't part of a contraction, are removed first.
+    return len(PUNCTUATION_RE.sub("", APOSTROPHE_RE.sub('"', text)).split())
+
+
+def count_sentences(text):
+
+    # Fragments of at most two words aren't counted as sentences.
+    sentences = SENTENCE_RE.findall(text)
+    ignored = sum(1 for sentence in sentences if count_lexicon(sentence) <= 2)
+    return max(1, len(sentences) - ignored)
+
+
+def get_word_counts(texts):
+    return np.array([len(text.split(" ")) for text in texts], dtype=np.float64)
+
+
+def get_text_stats(texts):
+
+    words = [text.split() for text in texts]
+    return {
+        "sentences": np.array([count_sentences(text) for text in texts], dtype=np.float64),
+        "polysyllables": np.array([sum(count_syllables(word) >= 3 for word in text_words) for text_words in words], dtype=np.float64)
+    }
+
+
+def get_smog(stats):
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        smog = 1.043 * np.sqrt(30 * stats["polysyllables"] / stats["sentences"]) + 3.1291
+    # textstat rounds half up to one decimal and scores texts with fewer than three sentences as 0.
+    return np.where(stats["sentences"] >= 3, np.floor(smog * 10 + 0.5) / 10, 0.0)
+
+
+def get_profile_readability(texts, features=READABILITY_FEATURES):
+    """
+    Requested readability features of an author profile, averaged over its texts. Sentences and syllables
+    are only counted if SMOG is requested.
+    """
+
+    profile = {}
+    if "MSWC" in features:
+        profile["MSWC"] = float(np.mean(get_word_counts(texts)))
+    if "SMOG" in features:
+        profile["SMOG"] = float(np.mean(get_smog(get_text_stats(texts))))
+    return profile
+
+
+@lru_cache(maxsize=4096)
+def analyze_sentiment(text):
+
+    global sentiment_analyzer
+    if sentiment_analyzer is None:
+        sentiment_analyzer = PatternAnalyzer()
+    sentiment = sentiment_analyzer.analyze(text)
+    return sentiment.polarity, sentiment.subjectivity
+
+
+def get_sentiment_scores(texts):
+    """
+    Polarity and subjectivity of each text from a single shared analyser. Recent texts are kept in a bounded
+    cache, so SP and SUBJ requested separately for the same texts analyse them once.
+    """
+
+    scores = np.array([analyze_sentiment(text) for text in texts], dtype=np.float64).reshape(-1, 2)
+    return scores[:, 0], scores[:, 1]
+
+
+def get_profile_sentiment(texts, features=SENTIMENT_FEATURES):
+
+    polarity, subjectivity = get_sentiment_scores(texts)
+    profile = {"SP": float(np.mean(polarity)), "SUBJ": float(np.mean(subjectivity))}
+    return {feature: profile[feature] for feature in features}
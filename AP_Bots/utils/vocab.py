@@ -0,0 +1,60 @@
+import os
+import json
+
+import numpy as np
+
+from AP_Bots.utils.file_utils import atomic_path
+
+
+class Vocab:
+    """
+    Interns tokens as int32 ids in first-seen order, so documents can be handled as id arrays and
+    counted with a single bincount instead of Python loops over strings. Tokens must be hashable; lists
+    (e.g. entity/label pairs read back from JSON) are interned as tuples.
+    """
+
+    def __init__(self, tokens=()):
+
+        self.tokens = []
+        self.token_ids = {}
+        for token in tokens:
+            self.add(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def add(self, token):
+
+        if isinstance(token, list):
+            token = tuple(token)
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.token_ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def encode(self, tokens):
+        return np.fromiter((self.add(token) for token in tokens), dtype=np.int32)
+
+    def count(self, ids):
+        return np.bincount(ids, minlength=len(self))
+
+    def get_count(self, counts, token):
+
+        token_id = self.token_ids.get(token)
+        return int(counts[token_id]) if token_id is not None else 0
+
+    def decode(self, ids):
+        return [self.tokens[token_id] for token_id in ids]
+
+    def save(self, path):
+
+        with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(self.tokens, f)
+
+    @classmethod
+    def load(cls, path):
+
+        with open(path, "r") as f:
+            return cls(json.load(f))